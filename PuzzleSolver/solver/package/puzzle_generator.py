@@ -1,8 +1,12 @@
+import collections
+import concurrent.futures
+import copy
 import csv
 import statistics
 from typing import List, Tuple, Dict
 
 import abc
+import bisect
 import itertools
 import operator
 import logging
@@ -12,10 +16,18 @@ import time
 import random
 from tqdm import tqdm
 
+from .sat_solver import SatSolver
+
 import functools
+import hashlib
+import heapq
+import inspect
+import weakref
 
 import math
 import os
+import pickle
+import sys
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.StreamHandler())
@@ -26,6 +38,18 @@ if DEBUG:
 else:
     logger.setLevel(logging.WARNING)
 
+ENGINE_TRUTH_TABLE = 'truth_table'
+ENGINE_BACKTRACKING = 'backtracking'
+ENGINE_SAT = 'sat'
+
+SEARCH_RANDOM = 'random'
+SEARCH_ANNEALING = 'annealing'
+SEARCH_CONSTRUCTIVE = 'constructive'
+SEARCH_EXHAUSTIVE = 'exhaustive'
+
+TRACE_CONSISTENCY = 'consistency'
+TRACE_TRUTH = 'truth'
+
 MULTIPLIERS = {
     7: 1,
     6: 1.25,
@@ -35,19 +59,58 @@ MULTIPLIERS = {
 }
 CHARACTER_COUNT_BOUND = [3, 7]
 SOLUTION_COUNT_BOUND = [0, 2]
+# Backtracking and SAT never enumerate the whole scenario space, so they can handle much larger puzzles.
+SEARCH_ENGINE_CHARACTER_COUNT_BOUND = [3, 12]
 ALLOWED_REASON_DISTRIBUTION_DELTA = 0.25
+# How many fast-fail statement checks to make before re-ranking statements by their rejection history.
+FAST_FAIL_REORDER_INTERVAL = 64
+# The default memory budget for each scenario space's cache of per-speaker consistency masks.
+SPEAKER_MASK_CACHE_BYTES = 16 * 1024 * 1024
+# Puzzles with more symmetries than this are searched without using them, since every orbit is expanded on output.
+MAX_AUTOMORPHISMS = 720
 
 
-class CharacterIdentifierError(Exception):
-    pass
+class Tracer:
+    """
+    Records evaluation events in a ring buffer as (event, statement, scenario index, result, detail) tuples, rendering
+    nothing until they are read back.
+
+    Call sites check `enabled` before recording, so a disabled tracer costs one attribute lookup per evaluation.
+    """
+    def __init__(self, capacity=10000):
+        self.enabled = False
+        self.events = collections.deque(maxlen=capacity)
 
+    def enable(self, capacity=None):
+        if capacity is not None:
+            self.events = collections.deque(self.events, maxlen=capacity)
+        self.enabled = True
 
-class TooManyMonksError(Exception):
-    def __init__(self, monk_count):
-        self.message = "You asked for {} Monks, which is too many here.".format(monk_count)
+    def disable(self):
+        self.enabled = False
 
-    def __repr__(self):
-        return self.message
+    def clear(self):
+        self.events.clear()
+
+    def record(self, event, statement, scenario, result, detail=None):
+        self.events.append((event, statement, getattr(scenario, 'index', None), result, detail))
+
+    def iter_formatted_events(self):
+        for event, statement, index, result, detail in self.events:
+            if event == TRACE_CONSISTENCY:
+                yield 'Scenario {}: "{}" is {} as {}'.format(
+                    index, statement, 'consistent' if result else 'inconsistent', detail.title)
+            else:
+                yield 'Scenario {}: [{}] is {}'.format(index, statement, result)
+
+
+tracer = Tracer()
+if DEBUG:
+    tracer.enable()
+
+
+class CharacterIdentifierError(Exception):
+    pass
 
 
 class Character:
@@ -91,18 +154,52 @@ class Knave(Character):
 
 POSSIBLE_CHARACTERS = {Knight, Knave, Monk}
 
+# Fixed code for each character type, used wherever scenarios are stored compactly.
+CHARACTER_ENCODING = (Knight, Knave, Monk)
+CHARACTER_CODES = {kind: code for code, kind in enumerate(CHARACTER_ENCODING)}
+
+
+def popcount(mask: int) -> int:
+    return bin(mask).count('1')
+
+
+def choose(n: int, k: int) -> int:
+    if not 0 <= k <= n:
+        return 0
+    return math.factorial(n) // (math.factorial(k) * math.factorial(n - k))
+
+
+def partial_truth(possible_truth_values):
+    """
+    Collapses every truth value a statement could still take into True, False, or None if it is not yet decided.
+    """
+    values = set(possible_truth_values)
+    if len(values) == 1:
+        return values.pop()
+    return None
+
+
+def iter_mask_indexes(mask: int):
+    """
+    Yields the index of each set bit of `mask`, lowest first.
+    """
+    for index, bit in enumerate(reversed(bin(mask)[2:])):
+        if bit == '1':
+            yield index
+
 
 class Reason:
     def __init__(self, character_name: str, statement):
         self.character_name = character_name
         self.statement = statement
+        self.key = (character_name, statement)
 
     def __eq__(self, other):
         assert(isinstance(other, Reason))
-        return self.character_name == other.character_name and self.statement == other.statement
+        return self.key == other.key
 
     def __hash__(self):
-        return hash("{}||{}".format(self.character_name, hash(self.statement)))
+        return hash(self.key)
 
     def __str__(self):
         return "{} should not have said {}".format(self.character_name, self.statement)
@@ -117,18 +214,47 @@ class Scenario:
         self.character_types = character_types
         self.result = None  # Will be set after consistency is evaluated.
 
-    def _check_consistency(self) -> Tuple[bool, List[Reason]]:
+    def type_of(self, character_name: str):
+        try:
+            return self.character_types[character_name]
+        except KeyError:
+            raise CharacterIdentifierError("Cannot find character '{}'.".format(character_name))
+
+    def types(self):
+        return self.character_types.values()
+
+    def _identity(self):
+        """
+        The sorted (name, short identifier) pairs that make up this scenario.
+        """
+        return tuple(
+            (name, self.character_types[name].short_identifier)
+            for name in sorted(self.character_types)
+        )
+
+    def _check_consistency(self, fast_fail=False) -> Tuple[bool, List[Reason]]:
         """
         If it makes sense that each character would speak their respective phrases, returns True; otherwise False.
 
-        If False, returns a list of Reasons why it could have failed.
+        If False, returns a list of Reasons why it could have failed.  With `fast_fail`, stops at the first inconsistent
+        statement, checking the statements that have rejected the most scenarios so far first, so only that Reason is
+        returned.
 
         :returns: (is_consistent, reasons)
         """
+        if fast_fail:
+            for character_name, index, statement in self.puzzle.get_fast_fail_order():
+                speaking_character_type = self.type_of(character_name)
+                is_consistent = statement.evaluate_consistency(speaking_character_type=speaking_character_type, scenario=self)
+                self.puzzle.record_fast_fail_check(character_name, index, is_consistent)
+                if is_consistent is False:
+                    return False, [Reason(character_name, statement)]
+            return True, []
+
         reasons = []
         is_consistent = True
         for character_name, statements in self.puzzle.character_statements.items():
-            speaking_character_type = self.character_types[character_name]
+            speaking_character_type = self.type_of(character_name)
 
             # Note: Each of the statements this character says must be consistent independently.
             for statement in statements:
@@ -137,8 +263,8 @@ class Scenario:
                     is_consistent = False
         return is_consistent, reasons
 
-    def check_consistency(self) -> Tuple[bool, List[Reason]]:
-        result = self._check_consistency()
+    def check_consistency(self, fast_fail=False) -> Tuple[bool, List[Reason]]:
+        result = self._check_consistency(fast_fail=fast_fail)
         self.result = result
         return result
 
@@ -147,36 +273,630 @@ class Scenario:
         To be equal, two Scenario instances must only have the same character name-type assignments and character count.
         """
         assert(isinstance(other, Scenario))
-        if len(self.character_types) != len(other.character_types):
-            return False
-        for name, t in self.character_types.items():
-            if other.character_types[name] != t:
-                return False
-        return True
+        return self._identity() == other._identity()
 
     def __hash__(self):
-        """
-        TODO: This could be more efficient and less stupid.  ;)
-        """
-        character_string = "|"
-        for name in sorted(self.character_types):
-            t = self.character_types[name]
-            character_string += "{},{}|".format(name, t.short_identifier)
-        return hash(character_string)
+        return hash(self._identity())
 
     def __str__(self, joiner=" \t "):
-        names_and_identities = []
-        ordered_character_names = sorted(self.character_types.keys())
-        for name in ordered_character_names:
-            character_type = self.character_types[name]
-            names_and_identities.append("{}={}".format(name, character_type.short_identifier))
-        return joiner.join(names_and_identities)
+        return joiner.join("{}={}".format(name, identifier) for name, identifier in self._identity())
 
     def __repr__(self):
         return "<Scenario: {}>".format(self.__str__(joiner=', '))
 
 
-class Statement:
+class LruMaskCache:
+    """
+    Bitmasks under hashable keys, evicted least recently used first once their estimated size passes `max_bytes`.
+    """
+    entry_overhead = 200  # Rough bytes per entry for its key and dict slot, on top of the mask itself.
+
+    def __init__(self, max_bytes=SPEAKER_MASK_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._masks = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._masks)
+
+    def get(self, key):
+        mask = self._masks.get(key)
+        if mask is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._masks.move_to_end(key)
+        return mask
+
+    def put(self, key, mask: int):
+        if key in self._masks:
+            return
+        self._masks[key] = mask
+        self.size_bytes += sys.getsizeof(mask) + self.entry_overhead
+        while self.size_bytes > self.max_bytes and self._masks:
+            _, evicted = self._masks.popitem(last=False)
+            self.size_bytes -= sys.getsizeof(evicted) + self.entry_overhead
+
+
+def iter_arrangement_changes(value_count, slot_count):
+    """
+    Walks every arrangement of `slot_count` distinct values from `range(value_count)`, starting from slot i holding
+    value i, and yields each step as (slot, its new value).  Every step changes a single slot, as in a Gray code.
+
+    The last slot changes slowest, taking each value no later slot holds in turn.  When an earlier slot holds the value
+    it moves to, that slot first takes over the value it's leaving, so one step in between has a value in two slots.
+    """
+    slots = list(range(slot_count))
+    holders = [i if i < slot_count else None for i in range(value_count)]  # The slot holding each value.
+
+    def walk(slot):
+        if slot < 0:
+            return
+        start = slots[slot]
+        yield from walk(slot - 1)
+        for value in range(value_count):
+            holder = holders[value]
+            if value == start or (holder is not None and holder > slot):
+                continue
+            leaving = slots[slot]
+            if holder is None:
+                holders[leaving] = None
+            else:
+                slots[holder] = leaving
+                yield holder, leaving
+                holders[leaving] = holder
+            slots[slot] = value
+            holders[value] = slot
+            yield slot, value
+            yield from walk(slot - 1)
+
+    return walk(slot_count - 1)
+
+
+class ScenarioSpace:
+    """
+    Every scenario of a puzzle with at most `max_num_monks` Monks, without storing the scenarios themselves.
+
+    Scenarios come in blocks, fewest Monks first and then one per combination of Monk columns, each holding every
+    Knight and Knave assignment of the other columns with the first of them changing slowest.  So the type masks can be built a block at a time, and a scenario's row of character codes (see
+    `CHARACTER_ENCODING`) can be decoded from its index alone.  Character names are mapped to fixed column indexes
+    once, so scenarios can be evaluated by index without ever building a per-scenario dict.
+    """
+    def __init__(self, character_names, max_num_monks):
+        self.character_names = tuple(character_names)
+        self.width = len(self.character_names)
+        self.column_indexes = {name: i for i, name in enumerate(self.character_names)}
+        self.sorted_columns = tuple(sorted(self.column_indexes.items()))
+        self.max_num_monks = max_num_monks
+        # The index of the first scenario with each number of Monks.
+        self._monk_count_starts = []  # type: List[int]
+        size = 0
+        for monk_count in range(min(max_num_monks, self.width) + 1):
+            self._monk_count_starts.append(size)
+            size += choose(self.width, monk_count) << (self.width - monk_count)
+        self.size = size if self.width else 0
+        self.full_mask = (1 << self.size) - 1
+        self._type_masks = {}  # type: Dict[Tuple[str, type], int]
+        self._build_type_masks()
+        self._count_masks = {}  # type: Dict[frozenset, List[int]]
+        self._truth_tables = {}  # type: Dict[Statement, int]
+        self._precomputed_truth_tables = {}  # type: Dict[Statement, int]
+        # Keyed by (speaker name, statements).  Shared by forks, so puzzles with a speaker in common share their mask.
+        self.speaker_masks = LruMaskCache()
+        self.memo_hits = 0
+        self.memo_misses = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getstate__(self):
+        """
+        Leaves the speaker masks out of pickles, such as batches sent to workers, since they can outgrow everything
+        else here.
+        """
+        state = self.__dict__.copy()
+        state['speaker_masks'] = LruMaskCache(self.speaker_masks.max_bytes)
+        return state
+
+    def _build_type_masks(self):
+        """
+        Builds the Knave and Monk masks of every column as strings of bits, a block of scenarios at a time, and derives
+        the Knight masks from them.  Only one column's string is ever held at once.
+        """
+        if not self.width:
+            return
+        knave_blocks = [[] for _ in range(self.width)]
+        monk_blocks = [[] for _ in range(self.width)]
+        for monk_count in range(len(self._monk_count_starts)):
+            honest_count = self.width - monk_count
+            block_size = 1 << honest_count
+            all_set = '1' * block_size
+            none_set = '0' * block_size
+            # Lowest scenario first, the bits of the block's scenarios in which bit `b` of their offset is set.
+            bit_patterns = [
+                ('0' * (1 << bit) + '1' * (1 << bit)) * (block_size >> (bit + 1)) for bit in range(honest_count)
+            ]
+            for monk_columns in itertools.combinations(range(self.width), monk_count):
+                other_columns = [column for column in range(self.width) if column not in monk_columns]
+                for column in monk_columns:
+                    knave_blocks[column].append(none_set)
+                    monk_blocks[column].append(all_set)
+                # The first other column is the most significant bit of the offset, and a set bit is a Knave.
+                for position, column in enumerate(other_columns):
+                    knave_blocks[column].append(bit_patterns[honest_count - 1 - position])
+                    monk_blocks[column].append(none_set)
+        for column, name in enumerate(self.character_names):
+            knave = int('0' + ''.join(knave_blocks[column])[::-1], 2)
+            knave_blocks[column] = None
+            monk = int('0' + ''.join(monk_blocks[column])[::-1], 2)
+            monk_blocks[column] = None
+            self._type_masks[(name, Knave)] = knave
+            self._type_masks[(name, Monk)] = monk
+            self._type_masks[(name, Knight)] = self.full_mask ^ knave ^ monk
+
+    def row(self, index) -> Tuple[int, ...]:
+        """
+        The character codes of the scenario at `index`, decoded from where it falls among the blocks.
+        """
+        monk_count = bisect.bisect_right(self._monk_count_starts, index) - 1
+        honest_count = self.width - monk_count
+        combination_rank, offset = divmod(index - self._monk_count_starts[monk_count], 1 << honest_count)
+        # Unranks the Monk columns in the order of `itertools.combinations`.
+        monk_columns = set()
+        column = 0
+        for remaining in range(monk_count, 0, -1):
+            while True:
+                count = choose(self.width - column - 1, remaining - 1)
+                if combination_rank < count:
+                    break
+                combination_rank -= count
+                column += 1
+            monk_columns.add(column)
+            column += 1
+        knight_code, knave_code, monk_code = CHARACTER_CODES[Knight], CHARACTER_CODES[Knave], CHARACTER_CODES[Monk]
+        row = []
+        bit = honest_count - 1
+        for column in range(self.width):
+            if column in monk_columns:
+                row.append(monk_code)
+            else:
+                row.append(knave_code if offset >> bit & 1 else knight_code)
+                bit -= 1
+        return tuple(row)
+
+    def encode(self, index) -> int:
+        """
+        The scenario at `index` as a base-3 integer, with the first character as the most significant digit.
+        """
+        ret = 0
+        for code in self.row(index):
+            ret = ret * len(CHARACTER_ENCODING) + code
+        return ret
+
+    def scenario(self, puzzle, index):
+        return EncodedScenario(puzzle=puzzle, space=self, index=index)
+
+    def truth_table(self, statement) -> int:
+        """
+        The truth table of `statement` over this space, computed at most once per distinct (interned) statement however
+        many times it is shared between speakers or nested inside other statements.
+        """
+        table = self._precomputed_truth_tables.get(statement)
+        if table is None:
+            table = self._truth_tables.get(statement)
+        if table is None:
+            self.memo_misses += 1
+            table = statement.evaluate_truth_table(self)
+            self._truth_tables[statement] = table
+        else:
+            self.memo_hits += 1
+        return table
+
+    def memo_size(self) -> int:
+        """
+        How many truth tables the memo holds, not counting precomputed ones.
+        """
+        return len(self._truth_tables)
+
+    def clear_memo(self):
+        self._truth_tables.clear()
+        self.memo_hits = 0
+        self.memo_misses = 0
+
+    def precompute_truth_tables(self, statements):
+        """
+        Computes truth tables that outlive the memo and are shared with every fork of this space.
+        """
+        for statement in statements:
+            self._precomputed_truth_tables[statement] = statement.evaluate_truth_table(self)
+
+    def fork(self):
+        """
+        A space sharing this one's scenarios, masks, precomputed truth tables, and speaker masks, but with a memo of its
+        own.
+        """
+        space = copy.copy(self)
+        space.speaker_masks = self.speaker_masks  # Copying goes through `__getstate__`, which leaves these out.
+        space._truth_tables = {}
+        space.memo_hits = 0
+        space.memo_misses = 0
+        return space
+
+    def is_compatible_with(self, character_names, max_num_monks):
+        return set(self.character_names) == set(character_names) and self.max_num_monks == max_num_monks
+
+    def type_mask(self, character_name: str, kind) -> int:
+        """
+        Bitmask of the scenarios in which the named character is of the given kind.
+        """
+        try:
+            return self._type_masks[(character_name, kind)]
+        except KeyError:
+            raise CharacterIdentifierError("Cannot find character '{}'.".format(character_name))
+
+    def count_masks(self, kinds) -> List[int]:
+        """
+        For each count from 0 to the number of characters, the bitmask of the scenarios in which exactly that many
+        characters are of any of the given kinds.
+        """
+        key = frozenset(kinds)
+        if key not in self._count_masks:
+            masks = [self.full_mask] + [0] * self.width
+            for name in self.character_names:
+                matching = 0
+                for kind in key:
+                    matching |= self.type_mask(name, kind)
+                for count in range(self.width, 0, -1):
+                    masks[count] = (masks[count] & ~matching) | (masks[count - 1] & matching)
+                masks[0] &= ~matching
+            self._count_masks[key] = masks
+        return self._count_masks[key]
+
+    def bits_to_mask(self, truth_values) -> int:
+        """
+        Packs one truth value per scenario, in scenario order, into a bitmask.
+        """
+        return int('0' + ''.join('1' if truth else '0' for truth in truth_values)[::-1], 2)
+
+
+class EncodedScenario(Scenario):
+    """
+    A view onto one row of a `ScenarioSpace`.
+
+    Moving `index` re-targets the same instance at another row, so a whole space can be evaluated with one object.
+    The row is decoded the first time it is needed at each index.
+    """
+    def __init__(self, puzzle, space: ScenarioSpace, index: int):
+        self.puzzle = puzzle  # type: Puzzle
+        self.space = space
+        self.index = index
+        self.result = None
+        self._row_index = None
+        self._row = None
+
+    def row(self) -> Tuple[int, ...]:
+        if self._row_index != self.index:
+            self._row = self.space.row(self.index)
+            self._row_index = self.index
+        return self._row
+
+    @property
+    def character_types(self):
+        return {name: self.type_of(name) for name in self.space.character_names}
+
+    def type_of(self, character_name: str):
+        try:
+            column = self.space.column_indexes[character_name]
+        except KeyError:
+            raise CharacterIdentifierError("Cannot find character '{}'.".format(character_name))
+        return CHARACTER_ENCODING[self.row()[column]]
+
+    def types(self):
+        return [CHARACTER_ENCODING[code] for code in self.row()]
+
+    def _identity(self):
+        row = self.row()
+        return tuple(
+            (name, CHARACTER_ENCODING[row[column]].short_identifier)
+            for name, column in self.space.sorted_columns
+        )
+
+
+class PartialScenario(Scenario):
+    """
+    A scenario in which only some characters have been assigned a type so far.
+
+    `type_of` returns None for an unassigned character.
+    """
+    def __init__(self, puzzle, character_types: {str: type}):
+        super().__init__(puzzle=puzzle, character_types=character_types)
+        self.monk_count = sum(1 for kind in character_types.values() if kind == Monk)
+
+    def type_of(self, character_name: str):
+        if character_name not in self.puzzle.character_statements:
+            raise CharacterIdentifierError("Cannot find character '{}'.".format(character_name))
+        return self.character_types.get(character_name)
+
+    @property
+    def unassigned_count(self):
+        return self.puzzle.num_characters - len(self.character_types)
+
+    def is_complete(self):
+        return self.unassigned_count == 0
+
+    def possible_types_of(self, character_name: str):
+        kind = self.type_of(character_name)
+        if kind is not None:
+            return [kind]
+        if self.monk_count >= self.puzzle.max_num_monks:
+            return [k for k in CHARACTER_ENCODING if k != Monk]
+        return list(CHARACTER_ENCODING)
+
+    def possible_counts_of(self, kinds):
+        """
+        The range of values the number of characters of any of `kinds` could still take.
+        """
+        known = sum(1 for kind in self.types() if kind in kinds)
+        return range(known, known + self.unassigned_count + 1)
+
+    def assign(self, character_name: str, kind):
+        self.character_types[character_name] = kind
+        if kind == Monk:
+            self.monk_count += 1
+
+    def unassign(self, character_name: str):
+        if self.character_types.pop(character_name) == Monk:
+            self.monk_count -= 1
+
+
+class CnfEncoder:
+    """
+    Translates a puzzle into CNF with one boolean variable per (character, type) pair.
+
+    Compound statements are Tseitin-encoded, and counting statements share one unary counter per set of kinds.
+    """
+    def __init__(self, puzzle):
+        self.puzzle = puzzle  # type: Puzzle
+        self.solver = SatSolver()
+        self.type_vars = {}  # type: Dict[Tuple[str, type], int]
+        self._count_literals = {}  # type: Dict[frozenset, List[int]]
+        for name in puzzle.character_names:
+            for kind in CHARACTER_ENCODING:
+                self.type_vars[(name, kind)] = self.solver.new_var()
+        self.true_literal = self.solver.new_var()
+        self.solver.add_clause([self.true_literal])
+
+        for name in puzzle.character_names:
+            # Each character has exactly one type.
+            literals = [self.type_vars[(name, kind)] for kind in CHARACTER_ENCODING]
+            self.solver.add_clause(literals)
+            for l1, l2 in itertools.combinations(literals, 2):
+                self.solver.add_clause([-l1, -l2])
+        self.solver.add_clause(self.count_literals((Monk,))[:puzzle.max_num_monks + 1])
+
+        for name, statements in puzzle.character_statements.items():
+            for statement in statements:
+                truth = statement.encode_cnf(self)
+                # Knights only say true statements, and Knaves only false ones.
+                self.solver.add_clause([-self.type_vars[(name, Knight)], truth])
+                self.solver.add_clause([-self.type_vars[(name, Knave)], -truth])
+
+    def type_literal(self, character_name: str, kind) -> int:
+        try:
+            return self.type_vars[(character_name, kind)]
+        except KeyError:
+            raise CharacterIdentifierError("Cannot find character '{}'.".format(character_name))
+
+    def conjunction(self, literals) -> int:
+        """
+        A literal that is true if and only if all of `literals` are.
+        """
+        remaining = []
+        for literal in literals:
+            if literal == -self.true_literal:
+                return literal
+            if literal != self.true_literal:
+                remaining.append(literal)
+        if len(remaining) == 0:
+            return self.true_literal
+        if len(remaining) == 1:
+            return remaining[0]
+        gate = self.solver.new_var()
+        for literal in remaining:
+            self.solver.add_clause([-gate, literal])
+        self.solver.add_clause([gate] + [-literal for literal in remaining])
+        return gate
+
+    def disjunction(self, literals) -> int:
+        return -self.conjunction([-literal for literal in literals])
+
+    def exclusive_or(self, a: int, b: int) -> int:
+        gate = self.solver.new_var()
+        self.solver.add_clause([-gate, a, b])
+        self.solver.add_clause([-gate, -a, -b])
+        self.solver.add_clause([gate, -a, b])
+        self.solver.add_clause([gate, a, -b])
+        return gate
+
+    def count_literals(self, kinds) -> List[int]:
+        """
+        For each count from 0 to the number of characters, a literal that is true if and only if exactly that many
+        characters are of any of the given kinds.
+        """
+        key = frozenset(kinds)
+        if key not in self._count_literals:
+            exactly = [self.true_literal] + [-self.true_literal] * self.puzzle.num_characters
+            for name in self.puzzle.character_names:
+                matches = self.disjunction([self.type_literal(name, kind) for kind in key])
+                for count in range(self.puzzle.num_characters, 0, -1):
+                    exactly[count] = self.disjunction([
+                        self.conjunction([exactly[count], -matches]),
+                        self.conjunction([exactly[count - 1], matches]),
+                    ])
+                exactly[0] = self.conjunction([exactly[0], -matches])
+            self._count_literals[key] = exactly
+        return self._count_literals[key]
+
+
+class InternedStatementType(type):
+    """
+    Hash-conses statements: constructing a statement structurally identical to a live one returns that same object.
+
+    Statements are keyed on their class and bound constructor arguments.  Since sub-statements are interned first, the
+    key hashes cheaply, and its hash is kept as the statement's structural hash.
+    """
+    _interned = weakref.WeakValueDictionary()
+    _signatures = {}
+
+    def _bind_constructor_args(cls, args, kwargs):
+        """
+        The arguments `__init__` would receive, as one positional tuple with defaults filled in.
+        """
+        if cls not in InternedStatementType._signatures:
+            signature = inspect.signature(cls.__init__)
+            is_positional_only = all(
+                parameter.kind == inspect.Parameter.POSITIONAL_OR_KEYWORD and parameter.default is inspect.Parameter.empty
+                for parameter in list(signature.parameters.values())[1:]
+            )
+            InternedStatementType._signatures[cls] = (signature, len(signature.parameters) - 1, is_positional_only)
+        signature, parameter_count, is_positional_only = InternedStatementType._signatures[cls]
+        if not kwargs and is_positional_only and len(args) == parameter_count:
+            return args
+        bound = signature.bind(None, *args, **kwargs)
+        bound.apply_defaults()
+        return bound.args[1:]
+
+    def __call__(cls, *args, **kwargs):
+        constructor_args = cls._bind_constructor_args(args, kwargs)
+        key = (cls, constructor_args)
+        try:
+            statement = InternedStatementType._interned.get(key)
+        except TypeError:
+            # Unhashable arguments, such as a list, can't be interned.
+            statement = super().__call__(*args, **kwargs)
+            statement._is_frozen = True
+            return statement
+        if statement is None:
+            statement = super().__call__(*args, **kwargs)
+            object.__setattr__(statement, '_constructor_args', constructor_args)
+            object.__setattr__(statement, '_structural_hash', hash(key))
+            object.__setattr__(statement, '_is_frozen', True)
+            InternedStatementType._interned[key] = statement
+        return statement
+
+
+class Statement(metaclass=InternedStatementType):
+    is_commutative = False  # Whether reordering the constructor arguments leaves the meaning unchanged.
+    _is_frozen = False
+    _constructor_args = None  # Set once the statement is interned.
+    _structural_hash = None
+
+    def __setattr__(self, name, value):
+        if self._is_frozen:
+            raise AttributeError("{} is immutable.".format(type(self).__name__))
+        super().__setattr__(name, value)
+
+    def __reduce__(self):
+        """
+        Rebuilds through the constructor when unpickled, so statements from other processes are interned here too.
+        """
+        if self._constructor_args is None:
+            return super().__reduce__()
+        return type(self), self._constructor_args
+
+    def renamed(self, mapping: Dict[str, str]):
+        """
+        This statement with every character name it mentions replaced through `mapping`.  Names not in `mapping` are
+        kept as they are.
+        """
+        if self._constructor_args is None:
+            raise ValueError("{} was not interned, so it can't be rebuilt.".format(type(self).__name__))
+
+        def rename(arg):
+            if isinstance(arg, Statement):
+                return arg.renamed(mapping)
+            if isinstance(arg, str):
+                return mapping.get(arg, arg)
+            if isinstance(arg, tuple):
+                return tuple(rename(item) for item in arg)
+            return arg
+        return type(self)(*(rename(arg) for arg in self._constructor_args))
+
+    def get_canonical_repr(self, mapping: Dict[str, str]=None) -> str:
+        """
+        This statement's structure as a string that doesn't depend on the order of commutative operands.  Character
+        names are replaced through `mapping` first, if given.
+        """
+        args = []
+        for part in self._get_canonical_parts():
+            if isinstance(part, Statement):
+                args.append(part.get_canonical_repr(mapping))
+            elif isinstance(part, tuple):
+                name, = part
+                args.append(repr(mapping.get(name, name) if mapping else name))
+            else:
+                args.append(part)
+        if self.is_commutative:
+            args.sort()
+        return '{}({})'.format(type(self).__name__, ','.join(args))
+
+    def _get_canonical_parts(self):
+        """
+        The constructor arguments for `get_canonical_repr`: sub-statements, character names as 1-tuples, and everything
+        else already as its final string.  Worked out once per statement, since fingerprinting reuses the same ones.
+
+        Functions and classes, such as relations and character types, are written as their module and qualified name.
+        Raises ValueError for ones that have no stable name, such as lambdas and functions defined inside others, since
+        two different ones could be written the same.
+        """
+        parts = self.__dict__.get('_canonical_parts')
+        if parts is None:
+            if self._constructor_args is None:
+                raise ValueError("{} was not interned, so its arguments are unknown.".format(type(self).__name__))
+
+            def fixed_repr(arg):
+                if isinstance(arg, tuple):
+                    return '({})'.format(','.join(fixed_repr(item) for item in arg))
+                qualname = getattr(arg, '__qualname__', None)
+                if qualname is None:
+                    return repr(arg)
+                if '<' in qualname:
+                    raise ValueError("{} has an argument without a stable name: {}".format(
+                        type(self).__name__, qualname))
+                return '{}.{}'.format(arg.__module__, qualname)
+            parts = []
+            for arg in self._constructor_args:
+                if isinstance(arg, Statement):
+                    parts.append(arg)
+                elif isinstance(arg, str):
+                    parts.append((arg,))
+                elif isinstance(arg, tuple) and any(isinstance(item, (str, Statement)) for item in arg):
+                    raise ValueError("{} has names nested in its arguments.".format(type(self).__name__))
+                else:
+                    parts.append(fixed_repr(arg))
+            object.__setattr__(self, '_canonical_parts', parts)
+        return parts
+
+    def get_character_names(self) -> set:
+        """
+        Every character name this statement mentions, including inside sub-statements.
+        """
+        if self._constructor_args is None:
+            raise ValueError("{} was not interned, so its arguments are unknown.".format(type(self).__name__))
+        names = set()
+        pending = list(self._constructor_args)
+        while pending:
+            arg = pending.pop()
+            if isinstance(arg, Statement):
+                names |= arg.get_character_names()
+            elif isinstance(arg, str):
+                names.add(arg)
+            elif isinstance(arg, tuple):
+                pending.extend(arg)
+        return names
+
     def code_repr(self):
         return "{}({})".format(type(self).__name__, self.code_repr_instantiation())
 
@@ -184,20 +904,83 @@ class Statement:
     def code_repr_instantiation(self):
         raise NotImplementedError(type(self).__name__)
 
+    def get_cost(self) -> int:
+        """
+        A rough count of the work one evaluation of this statement takes.
+        """
+        return 1
+
     def evaluate_consistency(self, speaking_character_type, scenario: Scenario):
-        logger.debug('Evaluating consistency of "{}" as {}'.format(self, speaking_character_type.title))
+        if speaking_character_type == Monk:
+            result = True
+        elif speaking_character_type == Knight:
+            result = self.evaluate_truth(scenario=scenario)
+        elif speaking_character_type == Knave:
+            result = not self.evaluate_truth(scenario=scenario)
+        else:
+            result = None
+        if tracer.enabled:
+            tracer.record(TRACE_CONSISTENCY, self, scenario, result, speaking_character_type)
+        return result
+
+    @abc.abstractmethod
+    def evaluate_truth(self, scenario: Scenario) -> True | False:
+        raise NotImplementedError(type(self).__name__)
+
+    def evaluate_partial_truth(self, scenario: PartialScenario):
+        """
+        Three-valued truth: True or False once it is decided by the characters assigned so far, otherwise None.
+
+        The fallback waits until every character has been assigned.
+        """
+        if scenario.is_complete():
+            return self.evaluate_truth(scenario=scenario)
+        return None
+
+    def evaluate_partial_consistency(self, speaking_character_type, scenario: PartialScenario):
         if speaking_character_type == Monk:
             return True
-        truth = self.evaluate_truth(scenario=scenario)
+        truth = self.evaluate_partial_truth(scenario)
+        if truth is None:
+            return None
         if speaking_character_type == Knight:
             return truth
         if speaking_character_type == Knave:
             return not truth
 
     @abc.abstractmethod
-    def evaluate_truth(self, scenario: Scenario) -> True | False:
+    def encode_cnf(self, encoder: CnfEncoder) -> int:
+        """
+        Adds this statement's clauses to `encoder` and returns the literal that stands for its truth.
+        """
         raise NotImplementedError(type(self).__name__)
 
+    def evaluate_truth_table(self, space: ScenarioSpace) -> int:
+        """
+        Evaluates this statement over every scenario of `space` at once.
+
+        Bit `i` of the result is set if and only if the statement is true in scenario `i`.  Subclasses override this
+        with bitwise operations; the fallback evaluates each scenario in turn.
+        """
+        scenario = space.scenario(puzzle=None, index=0)
+
+        def truth_values():
+            for index in range(space.size):
+                scenario.index = index
+                yield self.evaluate_truth(scenario=scenario)
+        return space.bits_to_mask(truth_values())
+
+    def evaluate_consistency_table(self, speaking_character_name: str, space: ScenarioSpace) -> int:
+        """
+        Bitmask of the scenarios in which the named character could say this statement.
+        """
+        truth = space.truth_table(self)
+        return (
+            (space.type_mask(speaking_character_name, Knight) & truth)
+            | (space.type_mask(speaking_character_name, Knave) & ~truth)
+            | space.type_mask(speaking_character_name, Monk)
+        )
+
     @abc.abstractmethod
     def as_sentence(self):
         raise NotImplementedError(type(self).__name__)
@@ -207,8 +990,13 @@ class Statement:
         raise NotImplementedError(cls.__name__)
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if other is None or not isinstance(other, type(self)):
             return False
+        if self._constructor_args is not None and other._constructor_args is not None:
+            # Both are interned, so being structurally equal would have made them the same object.
+            return False
         return self.is_equal_to_instance(other)
 
     @abc.abstractmethod
@@ -222,6 +1010,8 @@ class Statement:
         return "<{}: {}>".format(type(self).__name__, str(self))
 
     def __hash__(self):
+        if self._structural_hash is not None:
+            return self._structural_hash
         return hash(repr(self))
 
 
@@ -229,6 +1019,15 @@ class TrueStatement(Statement):
     def evaluate_truth(self, scenario: Scenario):
         return True
 
+    def evaluate_partial_truth(self, scenario: PartialScenario):
+        return True
+
+    def encode_cnf(self, encoder: CnfEncoder):
+        return encoder.true_literal
+
+    def evaluate_truth_table(self, space: ScenarioSpace):
+        return space.full_mask
+
     def code_repr_instantiation(self):
         return ""
 
@@ -248,6 +1047,9 @@ class AbstractStatementCombiner(Statement):
     def code_repr(self):
         return "{}(\n{}\n)".format(type(self).__name__, ',\n'.join([s.code_repr() for s in self.statements]))
 
+    def get_cost(self):
+        return 1 + sum(statement.get_cost() for statement in self.statements)
+
     @abc.abstractmethod
     def for_each_statement(self, truth_value):
         """
@@ -263,14 +1065,45 @@ class AbstractStatementCombiner(Statement):
         """
         pass
 
+    @abc.abstractmethod
+    def combine_truth_tables(self, a: int, b: int) -> int:
+        pass
+
+    def encode_cnf(self, encoder: CnfEncoder):
+        literals = [statement.encode_cnf(encoder) for statement in self.statements]
+        if self.default_value():
+            return encoder.conjunction(literals)
+        return encoder.disjunction(literals)
+
+    def evaluate_truth_table(self, space: ScenarioSpace):
+        result = space.full_mask if self.default_value() else 0
+        for statement in self.statements:
+            result = self.combine_truth_tables(result, space.truth_table(statement))
+        return result
+
     def evaluate_truth(self, scenario: Scenario):
-        logger.debug("Evaluating truth of [{}] ".format(self))
+        result = self.default_value()
         for statement in self.statements:
             truth = statement.evaluate_truth(scenario=scenario)
+            decided = self.for_each_statement(truth_value=truth)
+            if decided is not None:
+                result = decided
+                break
+        if tracer.enabled:
+            tracer.record(TRACE_TRUTH, self, scenario, result)
+        return result
+
+    def evaluate_partial_truth(self, scenario: PartialScenario):
+        is_decided = True
+        for statement in self.statements:
+            truth = statement.evaluate_partial_truth(scenario)
+            if truth is None:
+                is_decided = False
+                continue
             result = self.for_each_statement(truth_value=truth)
             if result is not None:
                 return result
-        return self.default_value()
+        return self.default_value() if is_decided else None
 
     def is_equal_to_instance(self, other):
         assert(isinstance(other, AbstractStatementCombiner))
@@ -288,6 +1121,7 @@ class ConjunctiveStatement(AbstractStatementCombiner):
     Requires every statement to be true.  If no statements, value is true.
     """
     joining_string = ' AND '
+    is_commutative = True
 
     def for_each_statement(self, truth_value):
         if truth_value is False:
@@ -297,12 +1131,16 @@ class ConjunctiveStatement(AbstractStatementCombiner):
     def default_value(self):
         return True
 
+    def combine_truth_tables(self, a: int, b: int):
+        return a & b
+
 
 class DisjunctiveStatement(AbstractStatementCombiner):
     """
     Requires at least one statement to be true.  If no statements, value is false.
     """
     joining_string = ' OR '
+    is_commutative = True
 
     def for_each_statement(self, truth_value):
         if truth_value is True:
@@ -312,6 +1150,9 @@ class DisjunctiveStatement(AbstractStatementCombiner):
     def default_value(self):
         return False
 
+    def combine_truth_tables(self, a: int, b: int):
+        return a | b
+
 
 class Not(Statement):
     """
@@ -323,10 +1164,23 @@ class Not(Statement):
     def code_repr(self):
         return "{}({})".format(type(self).__name__, self.statement.code_repr())
 
+    def get_cost(self):
+        return 1 + self.statement.get_cost()
+
     def evaluate_truth(self, scenario: Scenario):
         truth = self.statement.evaluate_truth(scenario=scenario)
         return not truth
 
+    def evaluate_partial_truth(self, scenario: PartialScenario):
+        truth = self.statement.evaluate_partial_truth(scenario)
+        return None if truth is None else not truth
+
+    def evaluate_truth_table(self, space: ScenarioSpace):
+        return space.full_mask ^ space.truth_table(self.statement)
+
+    def encode_cnf(self, encoder: CnfEncoder):
+        return -self.statement.encode_cnf(encoder)
+
     def is_equal_to_instance(self, other):
         assert(isinstance(other, Not))
         return self.statement == other.statement
@@ -347,10 +1201,18 @@ class IsOfType(Statement):
         return "'{}', {}".format(self.target_name, self.claimed_character_type.__name__)
 
     def evaluate_truth(self, scenario: Scenario):
-        try:
-            return scenario.character_types[self.target_name] == self.claimed_character_type
-        except KeyError:
-            raise CharacterIdentifierError("Cannot find character '{}'.".format(self.target_name))
+        return scenario.type_of(self.target_name) == self.claimed_character_type
+
+    def evaluate_partial_truth(self, scenario: PartialScenario):
+        return partial_truth(
+            kind == self.claimed_character_type for kind in scenario.possible_types_of(self.target_name)
+        )
+
+    def evaluate_truth_table(self, space: ScenarioSpace):
+        return space.type_mask(self.target_name, self.claimed_character_type)
+
+    def encode_cnf(self, encoder: CnfEncoder):
+        return encoder.type_literal(self.target_name, self.claimed_character_type)
 
     def as_sentence(self):
         return "{} is a {}.".format(self.target_name, self.claimed_character_type.title)
@@ -368,6 +1230,8 @@ class IsOfType(Statement):
 
 
 class IsSameAs(Statement):
+    is_commutative = True
+
     def __init__(self, target_1_name: str, target_2_name: str):
         self.target_1_name = target_1_name
         self.target_2_name = target_2_name
@@ -376,17 +1240,26 @@ class IsSameAs(Statement):
         return "'{}', '{}'".format(self.target_1_name, self.target_2_name)
 
     def evaluate_truth(self, scenario: Scenario):
-        try:
-            target_1_kind = scenario.character_types[self.target_1_name]
-        except KeyError:
-            raise CharacterIdentifierError("Cannot find character '{}'.".format(self.target_1_name))
+        target_1_kind, target_2_kind = lookup(scenario, self.target_1_name, self.target_2_name)
+        return target_1_kind == target_2_kind
 
-        try:
-            target_2_kind = scenario.character_types[self.target_2_name]
-        except KeyError:
-            raise CharacterIdentifierError("Cannot find character '{}'.".format(self.target_2_name))
+    def evaluate_partial_truth(self, scenario: PartialScenario):
+        return partial_truth(
+            kind_1 == kind_2 for kind_1, kind_2 in itertools.product(
+                scenario.possible_types_of(self.target_1_name), scenario.possible_types_of(self.target_2_name))
+        )
 
-        return target_1_kind == target_2_kind
+    def evaluate_truth_table(self, space: ScenarioSpace):
+        ret = 0
+        for kind in CHARACTER_ENCODING:
+            ret |= space.type_mask(self.target_1_name, kind) & space.type_mask(self.target_2_name, kind)
+        return ret
+
+    def encode_cnf(self, encoder: CnfEncoder):
+        return encoder.disjunction([
+            encoder.conjunction([encoder.type_literal(self.target_1_name, kind), encoder.type_literal(self.target_2_name, kind)])
+            for kind in CHARACTER_ENCODING
+        ])
 
     def as_sentence(self):
         return "{} is the same as {}.".format(self.target_1_name, self.target_2_name)
@@ -404,13 +1277,7 @@ class IsSameAs(Statement):
 
 
 def lookup(scenario: Scenario, *keys):
-    ret = []
-    for key in keys:
-        try:
-            ret.append(scenario.character_types[key])
-        except KeyError:
-            raise CharacterIdentifierError("Cannot find character '{}'.".format(key))
-    return tuple(ret)
+    return tuple(scenario.type_of(key) for key in keys)
 
 
 class Honesty(Statement):
@@ -426,6 +1293,27 @@ class Honesty(Statement):
         target_1_kind, target_2_kind = lookup(scenario, self.target_1_name, self.target_2_name)
         return self.claimed_relation(target_1_kind.truth_quantifier, target_2_kind.truth_quantifier)
 
+    def evaluate_partial_truth(self, scenario: PartialScenario):
+        return partial_truth(
+            self.claimed_relation(kind_1.truth_quantifier, kind_2.truth_quantifier)
+            for kind_1, kind_2 in itertools.product(
+                scenario.possible_types_of(self.target_1_name), scenario.possible_types_of(self.target_2_name))
+        )
+
+    def evaluate_truth_table(self, space: ScenarioSpace):
+        ret = 0
+        for kind_1, kind_2 in itertools.product(CHARACTER_ENCODING, repeat=2):
+            if self.claimed_relation(kind_1.truth_quantifier, kind_2.truth_quantifier):
+                ret |= space.type_mask(self.target_1_name, kind_1) & space.type_mask(self.target_2_name, kind_2)
+        return ret
+
+    def encode_cnf(self, encoder: CnfEncoder):
+        return encoder.disjunction([
+            encoder.conjunction([encoder.type_literal(self.target_1_name, kind_1), encoder.type_literal(self.target_2_name, kind_2)])
+            for kind_1, kind_2 in itertools.product(CHARACTER_ENCODING, repeat=2)
+            if self.claimed_relation(kind_1.truth_quantifier, kind_2.truth_quantifier)
+        ])
+
     def as_sentence(self):
         return "{}'s honesty is {} {}'s honesty.".format(
             self.target_1_name,
@@ -477,11 +1365,30 @@ class CountOfType(Statement):
 
     def evaluate_truth(self, scenario: Scenario):
         count = 0
-        for t in scenario.character_types.values():
+        for t in scenario.types():
             if t == self.character_type:
                 count += 1
         return self.claimed_relation(count, self.claimed_count)
 
+    def evaluate_partial_truth(self, scenario: PartialScenario):
+        return partial_truth(
+            self.claimed_relation(count, self.claimed_count)
+            for count in scenario.possible_counts_of((self.character_type,))
+        )
+
+    def evaluate_truth_table(self, space: ScenarioSpace):
+        ret = 0
+        for count, mask in enumerate(space.count_masks((self.character_type,))):
+            if self.claimed_relation(count, self.claimed_count):
+                ret |= mask
+        return ret
+
+    def encode_cnf(self, encoder: CnfEncoder):
+        return encoder.disjunction([
+            literal for count, literal in enumerate(encoder.count_literals((self.character_type,)))
+            if self.claimed_relation(count, self.claimed_count)
+        ])
+
     def as_sentence(self):
         return "There are {op} {count} {kind}s.".format(
             op=english_operator_helper(self.claimed_relation),
@@ -516,13 +1423,39 @@ class CountOfTypes(Statement):
     def evaluate_truth(self, scenario: Scenario):
         n1 = 0
         n2 = 0
-        for t in scenario.character_types.values():
+        for t in scenario.types():
             if t == self.kind1:
                 n1 += 1
             if t == self.kind2:
                 n2 += 1
         return self.claimed_relation(n1, n2)
 
+    def evaluate_partial_truth(self, scenario: PartialScenario):
+        known_1 = scenario.possible_counts_of((self.kind1,))[0]
+        known_2 = scenario.possible_counts_of((self.kind2,))[0]
+        unassigned = scenario.unassigned_count
+        return partial_truth(
+            self.claimed_relation(known_1 + extra_1, known_2 + extra_2)
+            for extra_1 in range(unassigned + 1)
+            for extra_2 in range(unassigned + 1 - extra_1)
+        )
+
+    def evaluate_truth_table(self, space: ScenarioSpace):
+        ret = 0
+        for (n1, mask_1), (n2, mask_2) in itertools.product(
+                enumerate(space.count_masks((self.kind1,))), enumerate(space.count_masks((self.kind2,)))):
+            if self.claimed_relation(n1, n2):
+                ret |= mask_1 & mask_2
+        return ret
+
+    def encode_cnf(self, encoder: CnfEncoder):
+        return encoder.disjunction([
+            encoder.conjunction([literal_1, literal_2])
+            for (n1, literal_1), (n2, literal_2) in itertools.product(
+                enumerate(encoder.count_literals((self.kind1,))), enumerate(encoder.count_literals((self.kind2,))))
+            if self.claimed_relation(n1, n2)
+        ])
+
     def as_sentence(self):
         return "There are {} {} than/as {}.".format(english_operator_helper(self.claimed_relation), self.kind1, self.kind2)
 
@@ -536,13 +1469,31 @@ class SumOfTypes(Statement):
 
     def evaluate_truth(self, scenario: Scenario):
         n = 0
-        for t in scenario.character_types.values():
+        for t in scenario.types():
             if t in self.kinds:
                 n += 1
         return self.claimed_relation(n, self.count)
 
-    def as_sentence(self):
-        return "The sum of {} is {} {}.".format(self.kinds, english_operator_helper(self.claimed_relation), self.count)
+    def evaluate_partial_truth(self, scenario: PartialScenario):
+        return partial_truth(
+            self.claimed_relation(n, self.count) for n in scenario.possible_counts_of(self.kinds)
+        )
+
+    def evaluate_truth_table(self, space: ScenarioSpace):
+        ret = 0
+        for n, mask in enumerate(space.count_masks(self.kinds)):
+            if self.claimed_relation(n, self.count):
+                ret |= mask
+        return ret
+
+    def encode_cnf(self, encoder: CnfEncoder):
+        return encoder.disjunction([
+            literal for n, literal in enumerate(encoder.count_literals(self.kinds))
+            if self.claimed_relation(n, self.count)
+        ])
+
+    def as_sentence(self):
+        return "The sum of {} is {} {}.".format(self.kinds, english_operator_helper(self.claimed_relation), self.count)
 
 
 
@@ -554,17 +1505,49 @@ class AbstractConnective(Statement):
     def code_repr(self):
         return "{}(\n{},\n{}\n)".format(type(self).__name__, self.a.code_repr(), self.b.code_repr())
 
+    def get_cost(self):
+        return 1 + self.a.get_cost() + self.b.get_cost()
+
     @staticmethod
     @abc.abstractstaticmethod
     def evaluate_connective(a: bool, b: bool):
         raise NotImplementedError
 
+    @staticmethod
+    @abc.abstractstaticmethod
+    def evaluate_connective_table(a: int, b: int, full_mask: int):
+        raise NotImplementedError
+
     def evaluate_truth(self, scenario: Scenario):
         return self.evaluate_connective(
             self.a.evaluate_truth(scenario=scenario),
             self.b.evaluate_truth(scenario=scenario)
         )
 
+    def evaluate_partial_truth(self, scenario: PartialScenario):
+        a = self.a.evaluate_partial_truth(scenario)
+        b = self.b.evaluate_partial_truth(scenario)
+        return partial_truth(
+            self.evaluate_connective(a_value, b_value)
+            for a_value in ((True, False) if a is None else (a,))
+            for b_value in ((True, False) if b is None else (b,))
+        )
+
+    def evaluate_truth_table(self, space: ScenarioSpace):
+        return self.evaluate_connective_table(
+            space.truth_table(self.a),
+            space.truth_table(self.b),
+            space.full_mask,
+        )
+
+    @staticmethod
+    @abc.abstractstaticmethod
+    def encode_connective_cnf(encoder: CnfEncoder, a: int, b: int):
+        raise NotImplementedError
+
+    def encode_cnf(self, encoder: CnfEncoder):
+        return self.encode_connective_cnf(encoder, self.a.encode_cnf(encoder), self.b.encode_cnf(encoder))
+
     def is_equal_to_instance(self, other):
         assert(isinstance(other, AbstractConnective))
         return self.a == other.a and self.b == other.b
@@ -575,24 +1558,52 @@ class IfConnective(AbstractConnective):
     def evaluate_connective(a: bool, b: bool):
         return (not a) or b
 
+    @staticmethod
+    def evaluate_connective_table(a: int, b: int, full_mask: int):
+        return (full_mask ^ a) | b
+
+    @staticmethod
+    def encode_connective_cnf(encoder: CnfEncoder, a: int, b: int):
+        return encoder.disjunction([-a, b])
+
     def as_sentence(self):
         return "If {}, then {}.".format(self.a, self.b)
 
 
 class Biconditional(AbstractConnective):
+    is_commutative = True
+
     @staticmethod
     def evaluate_connective(a: bool, b: bool):
         return (a and b) or (not a and not b)
 
+    @staticmethod
+    def evaluate_connective_table(a: int, b: int, full_mask: int):
+        return full_mask ^ (a ^ b)
+
+    @staticmethod
+    def encode_connective_cnf(encoder: CnfEncoder, a: int, b: int):
+        return -encoder.exclusive_or(a, b)
+
     def as_sentence(self):
         return "{} if and only if {}.".format(self.a, self.b)
 
 
 class ExclusiveOrConnective(AbstractConnective):
+    is_commutative = True
+
     @staticmethod
     def evaluate_connective(a: bool, b: bool):
         return (a or b) and not(a and b)
 
+    @staticmethod
+    def evaluate_connective_table(a: int, b: int, full_mask: int):
+        return a ^ b
+
+    @staticmethod
+    def encode_connective_cnf(encoder: CnfEncoder, a: int, b: int):
+        return encoder.exclusive_or(a, b)
+
     def as_sentence(self):
         return "{} OR {}, BUT NOT BOTH.".format(self.a, self.b)
 
@@ -635,13 +1646,29 @@ class XXXSamenessCount(Statement):
 class AllTheSame(Statement):
     def evaluate_truth(self, scenario: Scenario):
         kind = None
-        for cur in scenario.character_types.values():
+        for cur in scenario.types():
             if kind is not None:
                 if cur != kind:
                     return False
             kind = cur
         return True
 
+    def evaluate_partial_truth(self, scenario: PartialScenario):
+        if len(set(scenario.types())) > 1:
+            return False
+        return True if scenario.is_complete() else None
+
+    def evaluate_truth_table(self, space: ScenarioSpace):
+        ret = space.full_mask if space.width == 0 else 0
+        for kind in CHARACTER_ENCODING:
+            ret |= space.count_masks((kind,))[space.width]
+        return ret
+
+    def encode_cnf(self, encoder: CnfEncoder):
+        return encoder.disjunction([
+            encoder.count_literals((kind,))[encoder.puzzle.num_characters] for kind in CHARACTER_ENCODING
+        ])
+
     def as_sentence(self):
         return "All of us are the same."
 
@@ -651,28 +1678,61 @@ class AllDifferent(Statement):
         """
         If any distinct two are the same, returns False.
         """
-        for n1, k1 in scenario.character_types.items():
-            for n2, k2 in scenario.character_types.items():
-                if n1 == n2:
-                    continue
-                if k1 == k2:
-                    return False
-        return True
+        kinds = list(scenario.types())
+        return len(set(kinds)) == len(kinds)
+
+    def evaluate_partial_truth(self, scenario: PartialScenario):
+        kinds = list(scenario.types())
+        if len(set(kinds)) < len(kinds):
+            return False
+        return True if scenario.is_complete() else None
+
+    def evaluate_truth_table(self, space: ScenarioSpace):
+        ret = space.full_mask
+        for kind in CHARACTER_ENCODING:
+            count_masks = space.count_masks((kind,))
+            ret &= count_masks[0] | (count_masks[1] if space.width > 0 else 0)
+        return ret
+
+    def encode_cnf(self, encoder: CnfEncoder):
+        return encoder.conjunction([
+            encoder.disjunction(encoder.count_literals((kind,))[:2]) for kind in CHARACTER_ENCODING
+        ])
 
     def as_sentence(self):
         return "All of us are different."
 
 
 class Puzzle:
-    def __init__(self, character_names_and_statements: {str: [Statement]}, allow_monks=True):
+    solve_cache = None  # A `SolveCache` that `solve` looks puzzles up in first, when set.
+
+    def __init__(self, character_names_and_statements: {str: [Statement]}, allow_monks=True, engine=ENGINE_TRUTH_TABLE,
+                 space=None):
+        """
+        :param space: A `ScenarioSpace` to fork instead of building one, such as one shared by every puzzle a
+            `PuzzleGenerator` makes.  Ignored unless it matches this puzzle's characters and Monk limit.
+        """
         self.is_solved = False
-        self.scenarios = []
+        self.engine = engine
+        self.space = None  # type: ScenarioSpace
+        self._shared_space = space
+        self._consistent_scenarios = None  # type: List[Scenario]
+        self._fast_fail_order = None  # type: List[Tuple[str, int, Statement]]
+        self._fast_fail_history = {}  # type: Dict[Tuple[str, int], List[int]]
+        self._fast_fail_checks_since_reorder = 0
         self.character_names = []
         self.character_statements = {}
-        self._rejection_reason_lists = []  # type: List[List[Reason]]
-        self._reason_count_per_scenario = -1  # type: List[int]
+        # What `solve` keeps: for each character, the scenarios each of its statements rejects, and for each count, the
+        # scenarios rejected by exactly that many characters.  Everything else is derived from these masks on demand.
+        self._rejected_masks = {}  # type: Dict[str, List[int]]
+        self._reason_count_masks = None  # type: List[int]
         self._number_of_characters_uniquely_eliminating_scenario = 0
         self._score = None
+        self._memo_hits = 0
+        self._memo_misses = 0
+        self._automorphisms = None  # type: List[Tuple[int, ...]]
+        self._canonical_form = None
+        self._canonical_order = None  # type: List[str]
 
         for character_name, statements in character_names_and_statements.items():
             if statements is None:
@@ -696,6 +1756,67 @@ class Puzzle:
                 ret += "\n\t {}".format(statement)
         return ret
 
+    def replace_statement(self, character_name, index, statement: Statement):
+        """
+        Replaces one of a character's statements.  The next solve only re-evaluates the new statement.
+        """
+        statements = list(self._get_statements_to_edit(character_name))
+        statements[index] = statement
+        self._edit_statements(character_name, statements, index, replaces=True)
+
+    def add_statement(self, character_name, statement: Statement):
+        """
+        Gives a character another statement.  The next solve only evaluates the new statement.
+        """
+        statements = list(self._get_statements_to_edit(character_name)) + [statement]
+        self._edit_statements(character_name, statements, len(statements) - 1, replaces=False)
+
+    def remove_statement(self, character_name, index):
+        """
+        Takes one of a character's statements away.  The next solve evaluates nothing new.
+        """
+        statements = list(self._get_statements_to_edit(character_name))
+        del statements[index]
+        self._edit_statements(character_name, statements, index, replaces=None)
+
+    def _get_statements_to_edit(self, character_name):
+        if character_name not in self.character_statements:
+            raise CharacterIdentifierError("Cannot find character '{}'.".format(character_name))
+        return self.character_statements[character_name]
+
+    def _edit_statements(self, character_name, statements, index, replaces):
+        """
+        Installs a character's edited statements, keeping the inconsistency tables of every statement that is unchanged
+        and forgetting everything derived from the old statements.
+
+        :param replaces: True if the statement at `index` was replaced, False if it was inserted, and None if removed.
+        """
+        # A new list, since the old one may still belong to whoever built the puzzle.
+        self.character_statements[character_name] = statements
+        masks = self._rejected_masks.get(character_name)
+        if masks is not None:
+            masks = list(masks)
+            if replaces is True:
+                masks[index] = None
+            elif replaces is False:
+                masks.insert(index, None)
+            else:
+                del masks[index]
+            self._rejected_masks[character_name] = masks
+
+        self.is_solved = False
+        self._consistent_scenarios = None
+        self._reason_count_masks = None
+        self._score = None
+        self._automorphisms = None
+        self._canonical_form = None
+        self._canonical_order = None
+        self._fast_fail_order = None
+        # Statement indexes may have shifted, so this character's history no longer lines up.
+        self._fast_fail_history = {
+            key: history for key, history in self._fast_fail_history.items() if key[0] != character_name
+        }
+
     def print_puzzle_with_solutions(self):
         print(self.get_character_statements_as_string())
         print(self.get_solution_count(), 'possible solutions exist')
@@ -713,37 +1834,267 @@ class Puzzle:
             max_num_monks -= 1
         return max_num_monks
 
-    def _generate_scenario(self, identity_ordering: [type]):
+    def _generate_scenarios(self):
         """
-        Generates a scenario, rejecting a scenario with too many Monks.
+        Packs every scenario with an allowed number of Monks into this puzzle's `ScenarioSpace`.
         """
-        character_types = {}
-        i = 0
-        monk_count = 0
-        for name in self.character_names:
-            if identity_ordering[i] == Monk:
-                monk_count += 1
-            character_types[name] = identity_ordering[i]
-            if monk_count > self.max_num_monks:
-                raise TooManyMonksError(monk_count)
-            i += 1
-        return Scenario(puzzle=self, character_types=character_types)
+        shared = self._shared_space
+        if shared is not None and shared.is_compatible_with(self.character_names, self.max_num_monks):
+            self.space = shared.fork()
+        else:
+            self.space = ScenarioSpace(self.character_names, self.max_num_monks)
 
-    def _generate_scenarios(self):
-        self.scenarios = []  # Clears all scenarios first.
-        possible_characters = set(POSSIBLE_CHARACTERS)
-        if self.max_num_monks == 0:
-            # Optimizes product if no monks are allowed.
-            possible_characters.remove(Monk)
-        for identity_ordering in itertools.product(possible_characters, repeat=self.num_characters):
-            try:
-                scenario = self._generate_scenario(identity_ordering)
-            except TooManyMonksError:
+    def iter_scenarios(self):
+        """
+        Yields one `EncodedScenario` that is moved across every row of the scenario space.
+        """
+        if self.space is None:
+            self._generate_scenarios()
+        scenario = self.space.scenario(puzzle=self, index=0)
+        for index in range(self.space.size):
+            scenario.index = index
+            yield scenario
+
+    def _get_automorphism_permutations(self) -> List[Tuple[int, ...]]:
+        """
+        The automorphisms as permutations of character indexes, identity first: `permutation[i]` is the index
+        character `i` is mapped to.
+        """
+        if self._automorphisms is not None:
+            return self._automorphisms
+        names = self.character_names
+        identity = tuple(range(self.num_characters))
+        try:
+            statement_counts = [collections.Counter(self.character_statements[name]) for name in names]
+            # A character can only be mapped to one saying the same things up to names.
+            anonymous = {name: '' for name in names}
+            signatures = [
+                collections.Counter(statement.renamed(anonymous) for statement in self.character_statements[name])
+                for name in names
+            ]
+            # Each character's statements can be checked as soon as everyone they mention has been mapped.
+            ready_at = [
+                max([i] + [names.index(mentioned) for statement in self.character_statements[name]
+                           for mentioned in statement.get_character_names() if mentioned in self.character_statements])
+                for i, name in enumerate(names)
+            ]
+        except ValueError:
+            self._automorphisms = [identity]
+            return self._automorphisms
+
+        permutations = []
+        images = [None] * self.num_characters
+        mapping = {}
+
+        def is_preserved(i):
+            renamed = collections.Counter({
+                statement.renamed(mapping): count for statement, count in statement_counts[i].items()
+            })
+            return renamed == statement_counts[images[i]]
+
+        def search(depth):
+            if len(permutations) > MAX_AUTOMORPHISMS:
+                return
+            if depth == self.num_characters:
+                permutations.append(tuple(images))
+                return
+            for image in range(self.num_characters):
+                if image in images[:depth] or signatures[image] != signatures[depth]:
+                    continue
+                images[depth] = image
+                mapping[names[depth]] = names[image]
+                if all(is_preserved(i) for i in range(depth + 1) if ready_at[i] == depth):
+                    search(depth + 1)
+                del mapping[names[depth]]
+            images[depth] = None
+
+        search(0)
+        if len(permutations) > MAX_AUTOMORPHISMS:
+            permutations = [identity]
+        permutations.remove(identity)
+        self._automorphisms = [identity] + permutations
+        return self._automorphisms
+
+    def get_automorphisms(self) -> List[Dict[str, str]]:
+        """
+        Every renaming of the characters that maps each character's statements onto those of the character they are
+        renamed to, identity first.  Renaming a consistent scenario this way always gives another consistent scenario.
+        """
+        names = self.character_names
+        return [
+            {names[i]: names[image] for i, image in enumerate(permutation)}
+            for permutation in self._get_automorphism_permutations()
+        ]
+
+    def get_canonical_form(self) -> str:
+        """
+        The puzzle written out with characters renamed by position and commutative operands sorted, so puzzles that
+        differ only in those ways share one form.
+
+        Characters are ordered by what they say with names left out.  Every ordering of characters that tie is tried,
+        up to `MAX_AUTOMORPHISMS` of them, and the least form is kept.
+        """
+        if self._canonical_form is None:
+            anonymous = {name: '' for name in self.character_names}
+            signatures = {
+                name: sorted(statement.get_canonical_repr(anonymous) for statement in self.character_statements[name])
+                for name in self.character_names
+            }
+            tied_groups = [
+                list(group)
+                for signature, group in itertools.groupby(sorted(self.character_names, key=signatures.get), key=signatures.get)
+            ]
+            orderings = itertools.product(*(itertools.permutations(group) for group in tied_groups))
+            forms = []
+            for ordering in itertools.islice(orderings, MAX_AUTOMORPHISMS):
+                order = [name for group in ordering for name in group]
+                mapping = {name: '#{}'.format(i) for i, name in enumerate(order)}
+                forms.append(('Monks<={};'.format(self.max_num_monks) + ';'.join(
+                    '[{}]'.format(','.join(sorted(
+                        statement.get_canonical_repr(mapping) for statement in self.character_statements[name]
+                    )))
+                    for name in order
+                ), order))
+            self._canonical_form, self._canonical_order = min(forms)
+        return self._canonical_form
+
+    def get_fingerprint(self) -> str:
+        """
+        A digest of `get_canonical_form`, stable across processes and runs.  Raises ValueError if a statement has an
+        argument without a stable name (see `Statement.get_canonical_repr`).
+        """
+        return hashlib.sha1(self.get_canonical_form().encode()).hexdigest()
+
+    def get_fingerprint_if_stable(self):
+        """
+        `get_fingerprint`, or None if this puzzle can't be fingerprinted without risking a collision with another.
+        """
+        try:
+            return self.get_fingerprint()
+        except ValueError:
+            return None
+
+    def _iter_orbit(self, character_types: Dict[str, type]):
+        """
+        Yields each distinct scenario the automorphisms map the given one to, starting with the given one.
+        """
+        names = self.character_names
+        seen = set()
+        for permutation in self._get_automorphism_permutations():
+            image = tuple(character_types[names[permutation.index(i)]] for i in range(self.num_characters))
+            if image not in seen:
+                seen.add(image)
+                yield Scenario(puzzle=self, character_types=dict(zip(names, image)))
+
+    def iter_consistent_scenarios_by_backtracking(self, use_symmetry=True):
+        """
+        Finds the consistent scenarios by assigning characters one at a time, never enumerating the scenario space.
+
+        A partial assignment is abandoned as soon as any assigned speaker has a statement that is already decided to be
+        inconsistent with their type.  With `use_symmetry`, only the lexicographically least scenario of each orbit
+        under the puzzle's automorphisms is searched for, and its whole orbit is yielded.
+        """
+        scenario = PartialScenario(puzzle=self, character_types={})
+        codes = [None] * self.num_characters
+        inverses = []
+        if use_symmetry:
+            inverses = [
+                [permutation.index(i) for i in range(self.num_characters)]
+                for permutation in self._get_automorphism_permutations()[1:]
+            ]
+
+        def is_orbit_leader():
+            """
+            False once some automorphism is certain to map the partial assignment to a lexicographically smaller one.
+            """
+            for inverse in inverses:
+                for code, source in zip(codes, inverse):
+                    image_code = codes[source]
+                    if code is None or image_code is None or image_code > code:
+                        break
+                    if image_code < code:
+                        return False
+            return True
+
+        def search(depth, pending):
+            """
+            :param pending: (speaker type, statement) pairs whose consistency is not decided yet.
+            """
+            still_pending = []
+            for speaking_character_type, statement in pending:
+                consistency = statement.evaluate_partial_consistency(speaking_character_type, scenario)
+                if consistency is False:
+                    return
+                if consistency is None:
+                    still_pending.append((speaking_character_type, statement))
+            if depth == self.num_characters:
+                assert(len(still_pending) == 0)
+                yield from self._iter_orbit(scenario.character_types)
+                return
+            name = self.character_names[depth]
+            for kind in scenario.possible_types_of(name):
+                scenario.assign(name, kind)
+                codes[depth] = CHARACTER_CODES[kind]
+                if is_orbit_leader():
+                    spoken = [(kind, statement) for statement in self.character_statements[name]]
+                    yield from search(depth + 1, still_pending + spoken)
+                scenario.unassign(name)
+            codes[depth] = None
+
+        yield from search(0, [])
+
+    def iter_consistent_scenarios_by_sat(self, use_symmetry=True):
+        """
+        Finds the consistent scenarios one model at a time with the embedded SAT solver.
+
+        With `use_symmetry`, each model's whole orbit under the puzzle's automorphisms is yielded and blocked at once,
+        so the solver is only asked for one model per orbit.
+        """
+        encoder = CnfEncoder(self)
+        for model in encoder.solver.iter_models(encoder.type_vars.values()):
+            character_types = {name: kind for (name, kind), var in encoder.type_vars.items() if model[var]}
+            if not use_symmetry:
+                yield Scenario(puzzle=self, character_types=character_types)
                 continue
-            self.scenarios.append(scenario)
+            for scenario in self._iter_orbit(character_types):
+                yield scenario
+                if scenario.character_types != character_types:
+                    encoder.solver.add_clause([
+                        -var if scenario.character_types[name] == kind else var
+                        for (name, kind), var in encoder.type_vars.items()
+                    ])
+
+    def get_fast_fail_order(self) -> List[Tuple[str, int, Statement]]:
+        """
+        Every (character name, statement index, statement), most likely to reject a scenario per unit of cost first.
 
-    def check_scenario(self, scenario, should_print=DEBUG):
-        result, reasons = scenario.check_consistency()
+        The order is re-ranked from the recorded check history every `FAST_FAIL_REORDER_INTERVAL` checks.
+        """
+        if self._fast_fail_order is None or self._fast_fail_checks_since_reorder >= FAST_FAIL_REORDER_INTERVAL:
+            def rejection_power(entry):
+                name, index, statement = entry
+                checks, rejections = self._fast_fail_history.get((name, index), (0, 0))
+                # Smoothed so that statements nobody has checked yet start out as likely as not to reject.
+                return -((rejections + 1) / (checks + 2)) / statement.get_cost()
+
+            order = [
+                (name, index, statement)
+                for name in self.character_names
+                for index, statement in enumerate(self.character_statements[name])
+            ]
+            self._fast_fail_order = sorted(order, key=rejection_power)
+            self._fast_fail_checks_since_reorder = 0
+        return self._fast_fail_order
+
+    def record_fast_fail_check(self, character_name, statement_index, is_consistent):
+        history = self._fast_fail_history.setdefault((character_name, statement_index), [0, 0])
+        history[0] += 1
+        if is_consistent is False:
+            history[1] += 1
+        self._fast_fail_checks_since_reorder += 1
+
+    def check_scenario(self, scenario, should_print=DEBUG, fast_fail=False):
+        result, reasons = scenario.check_consistency(fast_fail=fast_fail)
         if should_print:
             if result:
                 print('+++++ \t{}'.format(scenario))
@@ -752,100 +2103,278 @@ class Puzzle:
                     print('----- \t{} \t ---> {}'.format(scenario, reasons[0]))
         return result, reasons
 
-    def solve(self, should_print=DEBUG, save_work_to_csv=None):
-        if len(self.scenarios) == 0:
+    def get_inconsistency_tables(self) -> Dict[str, List[int]]:
+        """
+        For each character, the bitmask of scenarios in which each of their statements is inconsistent.
+        """
+        if self.space is None:
             self._generate_scenarios()
-        self._rejection_reason_lists = []
-        scenarios, results, reasons = [], [], []
-        reason_counts = []
-        unique_characters = set()
-        for scenario in self.scenarios:
-            is_scenario_consistent, scenario_reasons = self.check_scenario(scenario=scenario, should_print=should_print)
-            if save_work_to_csv:
-                scenarios.append(scenario)
-                results.append(is_scenario_consistent)
-            character_giveaways_count = {n: 0 for n in self.character_names}
-            for r in scenario_reasons:
-                assert(isinstance(r, Reason))
-                character_giveaways_count[r.character_name] += 1
-            c = len(self.character_names)
-            for a in character_giveaways_count.values():
-                if a > 0:
-                    c -= 1
-            reason_counts.append(c)
-            if c == 1:
-                for name, value in character_giveaways_count.items():
-                    if value == 0:
-                        unique_characters.add(name)
-            reasons.append(scenario_reasons)  # We'll use the reasons even if not saving to CSV.
-        if save_work_to_csv:
-            with open(save_work_to_csv, 'w') as f:
-                writer = csv.writer(f)
-                i = 0
-                for scenario, is_scenario_consistent, scenario_reasons in itertools.zip_longest(scenarios, results, reasons):
-                    assert(isinstance(scenario, Scenario))
-                    assert(isinstance(is_scenario_consistent, bool))
-                    assert(isinstance(scenario_reasons, List[Reason]) or scenario_reasons is None)
-                    if i == 0:
-                        header_row = []
-                        for name in sorted(scenario.character_types.keys()):
-                            header_row.append(name)
-                        header_row += [
-                            'Result',
-                            'Explanation',
-                            'Inconsistent Characters',
-                        ]
-                        writer.writerow(header_row)
-                    row = []
-                    for name in sorted(scenario.character_types):
-                        kind = scenario.character_types[name]
-                        assert(issubclass(kind, Character))
-                        row.append(kind.short_identifier)
-                    row.append('Consistent' if is_scenario_consistent else 'Inconsistent')
-                    if scenario_reasons:
-                        row.append(scenario_reasons)
-                        inconsistent_characters = set()
-                        for r in scenario_reasons:
-                            inconsistent_characters.add(r.character_name)
-                        row.append(", ".join(list(inconsistent_characters)))
-                    writer.writerow(row)
-                    i += 1
-        self._rejection_reason_lists = reasons
-        self._reason_count_per_scenario = reason_counts
+        full_mask = self.space.full_mask
+        return {
+            name: [
+                full_mask ^ statement.evaluate_consistency_table(name, self.space)
+                for statement in self.character_statements[name]
+            ]
+            for name in self.character_names
+        }
+
+    def _update_rejected_masks(self) -> Dict[str, List[int]]:
+        """
+        Fills in the inconsistency table of every statement that a previous solve or an edit left without one.
+        """
+        full_mask = self.space.full_mask
+        for name in self.character_names:
+            statements = self.character_statements[name]
+            masks = self._rejected_masks.get(name)
+            if masks is None:
+                masks = self._rejected_masks[name] = [None] * len(statements)
+            for index, statement in enumerate(statements):
+                if masks[index] is None:
+                    masks[index] = full_mask ^ statement.evaluate_consistency_table(name, self.space)
+        return self._rejected_masks
+
+    def solve(self, should_print=DEBUG, save_work_to_csv=None, use_cache=True):
+        """
+        :param use_cache: Whether to look the puzzle up in `Puzzle.solve_cache` first, if one is set.  A hit restores
+            the solutions, score, and unique character count without enumerating any scenarios; the other statistics
+            solve again the first time they are asked for.  Printing or saving the work always solves, as does a puzzle
+            without a stable fingerprint, since it could share one with a different puzzle.
+        """
+        cache = self.solve_cache if use_cache and not should_print and not save_work_to_csv else None
+        fingerprint = self.get_fingerprint_if_stable() if cache is not None else None
+        if fingerprint is None:
+            cache = None
+        if cache is not None:
+            result = cache.get(fingerprint)
+            if result is not None:
+                self._load_cached_result(result)
+                return
+        if self.space is None:
+            self._generate_scenarios()
+        space = self.space
+        hits_before, misses_before = space.memo_hits, space.memo_misses
+        inconsistency_tables = self._update_rejected_masks()
+        self._memo_hits = space.memo_hits - hits_before
+        self._memo_misses = space.memo_misses - misses_before
+
+        rejected_by_character = {}
+        rejected = 0
+        for character_name in self.character_names:
+            character_rejected = 0
+            for inconsistent in inconsistency_tables[character_name]:
+                character_rejected |= inconsistent
+            rejected_by_character[character_name] = character_rejected
+            rejected |= character_rejected
+        consistent = space.full_mask ^ rejected
+
+        # Counts, for each scenario, the characters that do not give away its inconsistency.
+        accepting_counts = [space.full_mask] + [0] * self.num_characters
+        for character_rejected in rejected_by_character.values():
+            accepting = space.full_mask ^ character_rejected
+            for count in range(self.num_characters, 0, -1):
+                accepting_counts[count] = (accepting_counts[count] & character_rejected) | (accepting_counts[count - 1] & accepting)
+            accepting_counts[0] &= character_rejected
+        unique_characters = {
+            name for name, character_rejected in rejected_by_character.items()
+            if accepting_counts[1] & ~character_rejected
+        }
+
+        self._consistent_scenarios = [space.scenario(puzzle=self, index=index) for index in iter_mask_indexes(consistent)]
+        self._rejected_masks = inconsistency_tables
+        self._reason_count_masks = accepting_counts
         self._number_of_characters_uniquely_eliminating_scenario = len(unique_characters)
+        self._score = -sum(count * popcount(mask) for count, mask in enumerate(accepting_counts)) / space.size
         self.is_solved = True
+        if cache is not None:
+            cache.put(fingerprint, self._get_cached_result())
+
+        if should_print:
+            reasons = self.get_rejection_reason_lists()
+            scenario = space.scenario(puzzle=self, index=0)
+            for index in range(space.size):
+                scenario.index = index
+                if (consistent >> index) & 1:
+                    print('+++++ \t{}'.format(scenario))
+                elif DEBUG is True:
+                    print('----- \t{} \t ---> {}'.format(scenario, reasons[index][0]))
+        if save_work_to_csv:
+            self._save_work_to_csv(save_work_to_csv)
+
+    def _get_cached_result(self):
+        """
+        What `solve_cache` keeps of a solve.  Solutions are listed by character code in canonical character order, so
+        that any puzzle with the same fingerprint can read them back.
+        """
+        self.get_canonical_form()
+        return {
+            'solutions': [
+                [CHARACTER_CODES[scenario.type_of(name)] for name in self._canonical_order]
+                for scenario in self._consistent_scenarios
+            ],
+            'score': self._score,
+            'unique_count': self._number_of_characters_uniquely_eliminating_scenario,
+        }
+
+    def _load_cached_result(self, result):
+        self.get_canonical_form()
+        self._consistent_scenarios = [
+            Scenario(puzzle=self, character_types={
+                name: CHARACTER_ENCODING[code] for name, code in zip(self._canonical_order, codes)
+            })
+            for codes in result['solutions']
+        ]
+        self._rejected_masks = {}
+        self._reason_count_masks = None
+        self._number_of_characters_uniquely_eliminating_scenario = result['unique_count']
+        self._score = result['score']
+        self._memo_hits = 0
+        self._memo_misses = 0
+        self.is_solved = True
+
+    def _require_rejection_masks(self):
+        """
+        Solves for the rejection masks behind the detailed statistics, which a solve answered from the cache skips.
+        """
+        if self._reason_count_masks is None:
+            self.solve(use_cache=False)
+
+    def _save_work_to_csv(self, path):
+        consistent_indexes = {scenario.index for scenario in self._consistent_scenarios}
+        sorted_columns = self.space.sorted_columns
+        with open(path, 'w') as f:
+            writer = csv.writer(f)
+            header_row = [name for name, column in sorted_columns]
+            header_row += [
+                'Result',
+                'Explanation',
+                'Inconsistent Characters',
+            ]
+            writer.writerow(header_row)
+            for index, scenario_reasons in enumerate(self.get_rejection_reason_lists()):
+                row = self.space.row(index)
+                csv_row = [CHARACTER_ENCODING[row[column]].short_identifier for name, column in sorted_columns]
+                csv_row.append('Consistent' if index in consistent_indexes else 'Inconsistent')
+                if scenario_reasons:
+                    csv_row.append(scenario_reasons)
+                    inconsistent_characters = set()
+                    for r in scenario_reasons:
+                        inconsistent_characters.add(r.character_name)
+                    csv_row.append(", ".join(list(inconsistent_characters)))
+                writer.writerow(csv_row)
 
     def get_score(self):
-        return -(statistics.mean(self.get_reason_counts_per_scenario()))
+        """
+        Cached by `solve`, since ranking compares the same puzzles many times.
+        """
+        if not self.is_solved:
+            self.solve()
+        return self._score
 
     def __lt__(self, other):
         assert(isinstance(other, Puzzle))
         return self.get_score() < other.get_score()
 
+    def _get_consistent_scenarios(self) -> List[Scenario]:
+        if self._consistent_scenarios is None:
+            if self.engine == ENGINE_TRUTH_TABLE:
+                self.solve()
+            else:
+                self.count_solutions()
+        return self._consistent_scenarios
+
     def get_consistent_scenario_set(self):
-        ret = set()
-        for scenario in self.scenarios:
-            if scenario.result[0] is True:
-                ret.add(scenario)
-        return ret
+        return set(self._get_consistent_scenarios())
+
+    def get_speaker_consistency_mask(self, character_name) -> int:
+        """
+        Bitmask of the scenarios consistent with everything the named character says.
+
+        Kept in the space's `speaker_masks` under the character's name and statements, so a puzzle sharing a space
+        with an earlier one only evaluates the speakers that changed.
+        """
+        if self.space is None:
+            self._generate_scenarios()
+        key = (character_name, tuple(self.character_statements[character_name]))
+        consistent = self.space.speaker_masks.get(key)
+        if consistent is None:
+            consistent = self.space.full_mask
+            for statement in self.character_statements[character_name]:
+                consistent &= statement.evaluate_consistency_table(character_name, self.space)
+            self.space.speaker_masks.put(key, consistent)
+        return consistent
+
+    def _iter_consistent_scenarios_by_truth_table(self):
+        """
+        Yields the consistent scenarios without collecting any rejection reasons or statistics.
+        """
+        if self.space is None:
+            self._generate_scenarios()
+        consistent = self.space.full_mask
+        for name in self.character_names:
+            consistent &= self.get_speaker_consistency_mask(name)
+            if consistent == 0:
+                return
+        for index in iter_mask_indexes(consistent):
+            yield self.space.scenario(puzzle=self, index=index)
+
+    def count_solutions(self, limit=None) -> int:
+        """
+        Counts the consistent scenarios, stopping as soon as more than `limit` have been found.
+
+        Skips everything `solve` does for statistics, so it is cheap enough to filter candidate puzzles with.
+
+        :returns: The solution count, or `limit + 1` if there are more than `limit` solutions.
+        """
+        if self._consistent_scenarios is not None:
+            count = len(self._consistent_scenarios)
+            return count if limit is None else min(count, limit + 1)
+        if self.engine == ENGINE_BACKTRACKING:
+            scenarios = self.iter_consistent_scenarios_by_backtracking()
+        elif self.engine == ENGINE_SAT:
+            scenarios = self.iter_consistent_scenarios_by_sat()
+        else:
+            scenarios = self._iter_consistent_scenarios_by_truth_table()
+        found = list(itertools.islice(scenarios, None if limit is None else limit + 1))
+        if limit is None or len(found) <= limit:
+            # Every solution was found, so later lookups do not need to search again.
+            self._consistent_scenarios = found
+        return len(found)
 
     def get_solution_count(self):
-        if not self.is_solved:
-            self.solve()
-        return len(self.get_consistent_scenario_set())
+        return len(self._get_consistent_scenarios())
 
     def get_rejection_reason_count(self) -> int:
         if not self.is_solved:
             self.solve()
-        return len(self._rejection_reason_lists)
+        return self.get_total_possibilities()
+
+    def get_rejected_mask(self, character_name) -> int:
+        """
+        Bitmask of the scenarios that at least one of the named character's statements gives away.
+        """
+        self._require_rejection_masks()
+        rejected = 0
+        for inconsistent in self._rejected_masks[character_name]:
+            rejected |= inconsistent
+        return rejected
 
     def get_reason_counts_per_scenario(self):
         """
         The number of unique characters that give away the inconsistency of scenarios.
         """
-        if not self.is_solved:
-            self.solve()
-        return self._reason_count_per_scenario
+        self._require_rejection_masks()
+        reason_counts = [0] * self.space.size
+        for count, mask in enumerate(self._reason_count_masks):
+            for index in iter_mask_indexes(mask):
+                reason_counts[index] = count
+        return reason_counts
+
+    def get_mean_reason_count(self):
+        """
+        The mean of `get_reason_counts_per_scenario`, which `solve` takes straight from the size of each count's mask
+        and keeps as the negated score.
+        """
+        return -self.get_score()
 
     def number_of_characters_uniquely_eliminating_scenario(self):
         if not self.is_solved:
@@ -854,54 +2383,74 @@ class Puzzle:
 
 
     def get_rejection_reason_lists(self):
-        if not self.is_solved:
-            self.solve()
-        return self._rejection_reason_lists
+        """
+        The `Reason`s each scenario is rejected for, indexed like the scenario space.  Built from the rejection masks
+        on every call, so only reports and the CSV pay for these objects.
+        """
+        self._require_rejection_masks()
+        reasons = [[] for _ in range(self.space.size)]
+        for character_name, statements in self.character_statements.items():
+            for statement, inconsistent in zip(statements, self._rejected_masks[character_name]):
+                for index in iter_mask_indexes(inconsistent):
+                    reasons[index].append(Reason(character_name, statement))
+        return reasons
 
     def get_character_helpfulness_hist(self):
-        ret = dict()
-        for name in self.character_names:
-            ret[name] = 0
-        for reasons in self.get_rejection_reason_lists():
-            for reason in reasons:
-                ret[reason.character_name] += 1
-        return ret
+        self._require_rejection_masks()
+        return {
+            name: sum(popcount(inconsistent) for inconsistent in self._rejected_masks[name])
+            for name in self.character_names
+        }
 
     def get_rejection_reasons_histogram(self) -> Dict[Reason, int]:
-        if not self.is_solved:
-            self.solve()
+        self._require_rejection_masks()
         hist = dict()
-        for reasons in self._rejection_reason_lists:
-            for reason in reasons:
-                if reason not in hist:
-                    hist[reason] = 0
-                hist[reason] += 1
+        for character_name, statements in self.character_statements.items():
+            for statement, inconsistent in zip(statements, self._rejected_masks[character_name]):
+                if inconsistent:
+                    reason = Reason(character_name, statement)
+                    hist[reason] = hist.get(reason, 0) + popcount(inconsistent)
         return hist
 
+    def get_memo_hit_rate(self):
+        """
+        The fraction of sub-statement truth table lookups in the last solve that were answered from the memo.
+        """
+        if not self.is_solved:
+            self.solve()
+        lookups = self._memo_hits + self._memo_misses
+        return self._memo_hits / lookups if lookups else 0
+
     def get_rejection_reasons_stdev(self):
         hist = self.get_rejection_reasons_histogram()
         values = hist.values()
         return statistics.stdev(values)
 
     def get_total_possibilities(self):
-        return len(self.scenarios)
+        if self.space is None:
+            self._generate_scenarios()
+        return len(self.space)
+
+    @property
+    def character_count_bound(self):
+        if self.engine in (ENGINE_BACKTRACKING, ENGINE_SAT):
+            return SEARCH_ENGINE_CHARACTER_COUNT_BOUND
+        return CHARACTER_COUNT_BOUND
 
     def is_valid_puzzle(self):
         return (
-            (CHARACTER_COUNT_BOUND[0] <= self.num_characters <= CHARACTER_COUNT_BOUND[1])
-            and (SOLUTION_COUNT_BOUND[0] <= self.get_solution_count() <= SOLUTION_COUNT_BOUND[1])
+            (self.character_count_bound[0] <= self.num_characters <= self.character_count_bound[1])
+            and (SOLUTION_COUNT_BOUND[0] <= self.count_solutions(limit=SOLUTION_COUNT_BOUND[1]) <= SOLUTION_COUNT_BOUND[1])
         )
 
     def has_maximum_monks(self, for_exactly_how_many_consistent_scenarios=None):
-        if not self.is_solved:
-            self.solve()
         if for_exactly_how_many_consistent_scenarios is None:
             for_exactly_how_many_consistent_scenarios = len(self.get_consistent_scenario_set())
         satisfactory_consistent_scenario_count = 0
         for consistent_scenario in self.get_consistent_scenario_set():
             assert(isinstance(consistent_scenario, Scenario))
             monks = 0
-            for name, kind in consistent_scenario.character_types.items():
+            for kind in consistent_scenario.types():
                 if kind == Monk:
                     monks += 1
             if monks == self.max_num_monks:
@@ -917,6 +2466,7 @@ class Puzzle:
         print('Unique character count:', self.number_of_characters_uniquely_eliminating_scenario(), file=file)
         print('Character Helpfulness:', sorted(self.get_character_helpfulness_hist().items()), file=file)
         print('Standard Deviation of Reasons: {}'.format(self.get_rejection_reasons_stdev()), file=file)
+        print('Sub-statement cache hit rate: {:0.1f}%'.format(self.get_memo_hit_rate() * 100), file=file)
 
     def code_repr(self):
         ret = "Puzzle({\n"
@@ -930,136 +2480,842 @@ class Puzzle:
         return ret
 
 
+PuzzleBatchResult = collections.namedtuple(
+    'PuzzleBatchResult',
+    ['candidate_count', 'valid_puzzle_count', 'mean_reason_counts', 'good_puzzles', 'duplicate_count'])
+
+
+class BloomFilter:
+    """
+    A set of hex digests, such as puzzle fingerprints, in constant memory.  Membership tests can give false positives
+    at roughly `error_rate` once `capacity` digests are added, but never false negatives.
+    """
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest: str):
+        # Double hashing on the two halves of the digest.
+        value = int(digest, 16)
+        a, b = value >> 64, value & ((1 << 64) - 1) | 1
+        return [(a + i * b) % self.size for i in range(self.hash_count)]
+
+    def add(self, digest: str):
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest: str):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+
+class SearchBudget:
+    """
+    Stops a generator run after `seconds` of wall-clock time or once it has found `good_puzzle_count` good puzzles,
+    whichever comes first, instead of after a fixed fraction of all candidates.
+
+    Rates are measured over the whole run, so the ETA follows the speed of the machine it actually runs on.  A run
+    resumed from a checkpoint carries on the clock and the counts of the run it continues.
+    """
+    def __init__(self, seconds=None, good_puzzle_count=None):
+        if seconds is None and good_puzzle_count is None:
+            raise ValueError('A budget needs a time limit, a good puzzle count, or both.')
+        self.seconds = seconds
+        self.good_puzzle_count = good_puzzle_count
+        self.start_time = None
+
+    def start(self, elapsed_seconds=0.0):
+        """
+        Starts the clock, with the `elapsed_seconds` a resumed run had already spent counted as spent.
+        """
+        self.start_time = time.monotonic() - elapsed_seconds
+
+    def get_elapsed(self) -> float:
+        return time.monotonic() - self.start_time
+
+    def get_rates(self, candidate_count, good_puzzle_count) -> Tuple[float, float]:
+        """
+        Candidates and good puzzles per second since the run started.
+        """
+        elapsed = max(self.get_elapsed(), 1e-9)
+        return candidate_count / elapsed, good_puzzle_count / elapsed
+
+    def get_progress(self, good_puzzle_count) -> float:
+        """
+        The fraction of the budget spent, which reaches 1 as soon as either limit does.
+        """
+        progress = 0.0
+        if self.seconds is not None:
+            progress = self.get_elapsed() / self.seconds if self.seconds > 0 else 1.0
+        if self.good_puzzle_count is not None:
+            found = good_puzzle_count / self.good_puzzle_count if self.good_puzzle_count > 0 else 1.0
+            progress = max(progress, found)
+        return min(progress, 1.0)
+
+    def is_spent(self, good_puzzle_count) -> bool:
+        return self.get_progress(good_puzzle_count) >= 1
+
+    def get_eta(self, candidate_count, good_puzzle_count):
+        """
+        Seconds until the budget is spent at the current rates, or None if there is only a good puzzle count and no
+        good puzzle has been found yet to measure a rate from.
+        """
+        etas = []
+        if self.seconds is not None:
+            etas.append(max(0.0, self.seconds - self.get_elapsed()))
+        if self.good_puzzle_count is not None:
+            good_rate = self.get_rates(candidate_count, good_puzzle_count)[1]
+            remaining = self.good_puzzle_count - good_puzzle_count
+            if remaining <= 0:
+                etas.append(0.0)
+            elif good_rate > 0:
+                etas.append(remaining / good_rate)
+        return min(etas) if etas else None
+
+    def describe(self, candidate_count, good_puzzle_count) -> str:
+        candidate_rate, good_rate = self.get_rates(candidate_count, good_puzzle_count)
+        eta = self.get_eta(candidate_count, good_puzzle_count)
+        return '{:0.0f} candidates/s // {:0.2f} good/s // ETA {}'.format(
+            candidate_rate, good_rate, '?' if eta is None else tqdm.format_interval(eta))
+
+
 class PuzzleGenerator:
-    def __init__(self, character_names, possible_statement_kinds):
+    statements_needed = 16  # Generates the combination of this many statements for `s`.
+    slots_per_speaker = 4  # How many of the statements in `s` each speaker's statement is built from.
+    batch_size = 250  # Candidates each worker checks between progress updates.
+    early_break = 0.00000000000005  # The fraction of all possible permutations to sample.
+    bloom_filter_threshold = 1000000  # Seen candidates move into a `BloomFilter` once there are more than this.
+    speaker_mask_cache_bytes = SPEAKER_MASK_CACHE_BYTES  # The memory budget for speaker masks shared across candidates.
+    exhaustive_memo_size = 65536  # How many truth tables the exhaustive search memoizes before clearing them.
+
+    def __init__(self, character_names, possible_statement_kinds, engine=ENGINE_TRUTH_TABLE, top_k=500):
+        """
+        :param top_k: How many of the best puzzles to keep for the ranked output.  None keeps every one.
+        """
         self.possible_names = character_names
         self.possible_statement_kinds = possible_statement_kinds
+        self.engine = engine
+        self.top_k = top_k
+        self.checkpoint = None  # The state of the current or last run.
+        self.top_puzzles = []  # type: List[Tuple[float, int, Puzzle]]
+        self.space = None  # type: ScenarioSpace
+        self._consistency_tables = None  # type: List[Tuple[str, Statement, int]]
+
+    def __getstate__(self):
+        """
+        Leaves the run's state out of pickles, such as the bound `generate_puzzle_batch` sent with every batch to a
+        worker, which only needs the names, kinds, engine, and space.
+        """
+        state = self.__dict__.copy()
+        state['checkpoint'] = None
+        state['top_puzzles'] = []
+        state['_consistency_tables'] = None
+        return state
+
+    def get_scenario_space(self) -> ScenarioSpace:
+        """
+        The scenario space every generated puzzle is solved over, with the truth table of every possible statement
+        computed once up front.  Candidates are then solved by combining these tables.
+        """
+        if self.space is None:
+            max_num_monks = Puzzle({name: [] for name in self.possible_names}).max_num_monks
+            self.space = ScenarioSpace(self.possible_names, max_num_monks)
+            self.space.speaker_masks.max_bytes = self.speaker_mask_cache_bytes
+            self.space.precompute_truth_tables(self.generate_possible_statements())
+        return self.space
 
     def generate_possible_statements(self):
         statements = []
         for statement_kind in self.possible_statement_kinds:
-            statements += statement_kind.generate_possibilities(self.possible_names, POSSIBLE_CHARACTERS)
+            # An ordered tuple, so that a seeded run samples the same statements in every process.
+            statements += statement_kind.generate_possibilities(self.possible_names, CHARACTER_ENCODING)
         return statements
 
-    def generate_puzzles(self, to_file=True):
+    @staticmethod
+    def make_statement(speaker_index, s: List[Statement]):
+        """
+        What the speaker at `speaker_index` says in `make_puzzle`, built from that speaker's own slots.
+        """
+        if speaker_index == 0:
+            return IfConnective(
+                Not(Biconditional(s[0], s[1])),
+                Biconditional(s[2], s[3]),
+            )
+        if speaker_index == 1:
+            return IfConnective(
+                Biconditional(s[0], s[1]),
+                Not(Biconditional(s[2], s[3])),
+            )
+        if speaker_index == 2:
+            return IfConnective(
+                Not(Biconditional(s[0], s[1])),
+                Biconditional(s[2], s[3]),
+            )
+        return IfConnective(
+            Biconditional(s[0], Not(s[1])),
+            Not(Biconditional(s[2], Not(s[3]))),
+        )
+
+    def make_puzzle(self, s: List[Statement]):
+        n = self.slots_per_speaker
+        return Puzzle({
+            self.possible_names[i]: self.make_statement(i, s[i * n:(i + 1) * n])
+            for i in range(self.statements_needed // n)
+        }, engine=self.engine, space=self.get_scenario_space())
+
+    @staticmethod
+    def is_good_puzzle(puzzle: Puzzle):
+        """
+        Restrictions to hopefully make a valid puzzle harder.
+        """
+        if not (puzzle.get_solution_count() == 2
+                and puzzle.has_maximum_monks(for_exactly_how_many_consistent_scenarios=2)):
+            return False
+
+        # Make sure each character says something fairly significant.
+        # if not puzzle.has_optimal_reason_distribution():
+        #     return False
+
+        scenarios = tuple(puzzle.get_consistent_scenario_set())
+        # type: [Scenario]
+        difference = 0
+        for name in puzzle.character_names:
+            if scenarios[0].type_of(name) != scenarios[1].type_of(name):
+                difference += 1
+        # Make sure all characters differ in both solutions.  (To hopefully result in more difficult puzzles.)
+        allowed_character_variance = 0
+        return difference >= len(puzzle.character_names) - allowed_character_variance
+
+    def generate_puzzle_batch(self, seed, candidate_count, extra_info=True, seen=None) -> PuzzleBatchResult:
+        """
+        Samples and checks `candidate_count` random candidate puzzles using its own `random.Random(seed)` stream.
+
+        This is the unit of work handed to each worker process.
+
+        :param seen: Fingerprints of valid candidates already checked, as a set or `BloomFilter`.  Candidates found in
+            it are skipped before being fully solved and scored, and the rest are added to it.  Defaults to a set for
+            this batch alone.
+        """
+        rng = random.Random(seed)
+        statements = self.generate_possible_statements()
+        if seen is None:
+            seen = set()
+        valid_puzzle_count = 0  # A valid puzzle has 0, 1, or 2 solutions.
+        duplicate_count = 0
+        mean_reason_counts = []
+        good_puzzles = []
+        for _ in range(candidate_count):
+            # Selects from possible statements in random order, without replacement.
+            puzzle = self.make_puzzle(rng.sample(statements, self.statements_needed))
+            # Counting solutions is cheaper than fingerprinting, so only candidates that pass it are looked up.
+            if not puzzle.is_valid_puzzle():
+                continue
+            fingerprint = puzzle.get_fingerprint_if_stable()
+            if fingerprint is not None:
+                if fingerprint in seen:
+                    duplicate_count += 1
+                    continue
+                seen.add(fingerprint)
+            valid_puzzle_count += 1
+            if not self.is_good_puzzle(puzzle):
+                continue
+            if extra_info:
+                mean_reason_counts.append(puzzle.get_mean_reason_count())
+            good_puzzles.append(puzzle)
+        return PuzzleBatchResult(candidate_count, valid_puzzle_count, mean_reason_counts, good_puzzles, duplicate_count)
+
+    @staticmethod
+    def load_checkpoint(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    @staticmethod
+    def save_checkpoint(path, checkpoint):
+        """
+        Writes to a temporary file first, so a crash mid-write never leaves a corrupt checkpoint behind.
+        """
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'wb') as f:
+            pickle.dump(checkpoint, f)
+        os.replace(temporary_path, path)
+
+    def iter_good_puzzles(self, workers=1, seed=None, checkpoint_path=None, checkpoint_every=20, budget=None,
+                          found_file=None):
+        """
+        Yields each new good puzzle as soon as the batch that found it finishes.
+
+        Keeps the best `top_k` puzzles in `self.top_puzzles`, a bounded min-heap of (score, arrival order, puzzle) keyed
+        on each puzzle's cached score, so memory stays flat however long the run goes.
+
+        :param workers: How many processes to sample and solve candidates in.  Each batch of candidates gets its own
+            seeded random stream, and good puzzles are merged and deduplicated here.
+        :param seed: Seeds the stream that every batch's seed is drawn from, so a run can be reproduced.
+        :param checkpoint_path: If given, progress is saved here every `checkpoint_every` batches, and a run started
+            with an existing checkpoint continues from it instead of starting over.
+        :param budget: A `SearchBudget` to stop on, checked between batches, instead of after `early_break` of all
+            candidates.  A resumed run keeps the stop of the run it continues, and counts the time that run had spent
+            up to its last checkpoint toward the budget.
+        :param found_file: An open file the caller writes each yielded puzzle to.  A fresh run empties it and each
+            checkpoint saves its length, which a resumed run cuts it back to, so the puzzles found after the last
+            checkpoint aren't written again when the resumed run finds them again.
+        """
         statements = self.generate_possible_statements()
-        statements_needed = 16  # Generates the combination of this many statements for `s`.
+        statements_needed = self.statements_needed
         total_count = math.factorial(len(statements)) // math.factorial(len(statements) - statements_needed)
         print(len(statements), 'statements to choose from')
         print(total_count, 'total possible permutations')
 
-        good_puzzles = []
-        valid_puzzle_count = 0  # A valid puzzle has 0, 1, or 2 solutions.
-
-        i = 0
-        mean_reason_counts = []
-        EARLY_BREAK = 0.00000000000005
         EXTRA_INFO = True
-        stop = int(total_count * EARLY_BREAK)
-        progress = tqdm(total=stop, smoothing=0.15)
-        # helpfulness = dict()
-        # for name in self.possible_names:
-        #     helpfulness[name] = []
-
-        def update_progress():
-            progress.update()
+        stop = total_count if budget is not None else int(total_count * self.early_break)
+        # Computed before any batch is handed to a worker, so every worker receives the same tables.
+        self.get_scenario_space()
+
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            checkpoint = self.load_checkpoint(checkpoint_path)
+            assert(checkpoint['batch_size'] == self.batch_size)
+            stop = checkpoint['stop']
+            print('Resuming from', checkpoint_path, 'after', checkpoint['candidate_count'], 'candidates')
+            if found_file is not None:
+                found_file.truncate(checkpoint['found_file_offset'])
+                found_file.seek(0, os.SEEK_END)
+        else:
+            if seed is None:
+                seed = random.getrandbits(64)
+            checkpoint = {
+                'rng_state': random.Random(seed).getstate(),
+                'stop': stop,
+                'batch_size': self.batch_size,
+                'completed_batches': set(),
+                'candidate_count': 0,
+                'valid_puzzle_count': 0,  # A valid puzzle has 0, 1, or 2 solutions.
+                'mean_reason_count_sum': 0,
+                'mean_reason_count_n': 0,
+                'good_puzzle_count': 0,
+                'duplicate_count': 0,
+                'seen_puzzles': set(),  # Fingerprints of the good puzzles.
+                # Fingerprints of every valid candidate, when batches run in this process and can share them.
+                'seen_candidates': set() if workers == 1 else None,
+                'top_puzzles': [],
+                'found_file_offset': 0,  # How much of `found_file` the run had written at this checkpoint.
+                'elapsed_seconds': 0.0,  # How long the run had been going at this checkpoint, across resumes.
+            }
+            if found_file is not None:
+                found_file.truncate(0)
+                found_file.seek(0)
+        if workers == 1 and checkpoint['seen_candidates'] is None:
+            checkpoint['seen_candidates'] = set()  # Resumed from a run with several workers.
+        self.checkpoint = checkpoint
+        self.top_puzzles = checkpoint['top_puzzles']
+        seeds = random.Random()
+        seeds.setstate(checkpoint['rng_state'])
+
+        def iter_remaining_batches():
+            """
+            Yields (index, seed, size) for each batch not yet completed.  Batches are made as they're needed, since a
+            budgeted run can have far more of them than it will ever get to.
+            """
+            for index, start in enumerate(range(0, stop, self.batch_size)):
+                batch_seed = seeds.getrandbits(64)
+                if index not in checkpoint['completed_batches']:
+                    yield index, batch_seed, min(self.batch_size, stop - start)
+
+        remaining_batches = iter_remaining_batches()
+
+        def is_budget_spent():
+            return budget is not None and budget.is_spent(checkpoint['good_puzzle_count'])
+
+        start_time = time.monotonic() - checkpoint['elapsed_seconds']
+        if budget is not None:
+            budget.start(checkpoint['elapsed_seconds'])
+        progress = tqdm(total=None if budget is not None else stop, initial=checkpoint['candidate_count'], smoothing=0.15)
+
+        def merge_batch(batch: PuzzleBatchResult):
+            """
+            Folds a finished batch into the run's counters and returns the good puzzles not seen before.
+            """
+            checkpoint['candidate_count'] += batch.candidate_count
+            checkpoint['valid_puzzle_count'] += batch.valid_puzzle_count
+            checkpoint['mean_reason_count_sum'] += sum(batch.mean_reason_counts)
+            checkpoint['mean_reason_count_n'] += len(batch.mean_reason_counts)
+            checkpoint['duplicate_count'] += batch.duplicate_count
+            new_puzzles = []
+            for puzzle in batch.good_puzzles:
+                # Different workers can find the same puzzle.
+                if self._keep_good_puzzle(puzzle):
+                    new_puzzles.append(puzzle)
+
+            progress.update(batch.candidate_count)
+            i = checkpoint['candidate_count']
             if i > 1 and EXTRA_INFO:
                 progress.set_description("{good:0.1f}% good ({good_count}) // avg reason count: {reason_count:0.2f} // {valid:0.1f}% valid".format(
-                    good=len(good_puzzles) / i * 100,
-                    good_count=len(good_puzzles),
-                    reason_count=statistics.mean(mean_reason_counts) if len(mean_reason_counts) > 1 else -1,
-                    valid=valid_puzzle_count / i * 100,
-                ))
-            # if i > 1:
-            #     d = "Avg. Helpfulness: "
-            #     for n in self.possible_names:
-            #         d += "({}: {:0.1f}) ".format(n, statistics.mean(helpfulness[n]))
-            #     progress.set_description(d)
-
-        for i in range(1, stop):
-            # Selects from possible statements in random order, without replacement.
-            s = []
-            possible_statement_indexes = set(range(len(statements)))
-            for si in range(statements_needed):
-                index = random.choice(list(possible_statement_indexes))
-                s.append(statements[index])
-                possible_statement_indexes.remove(index)
-
-            update_progress()
-
-            # Don't use any two statements twice.
-            for s1, s2 in itertools.product(s, repeat=2):
-                if s1 == s2:
-                    continue
+                    good=checkpoint['good_puzzle_count'] / i * 100,
+                    good_count=checkpoint['good_puzzle_count'],
+                    reason_count=checkpoint['mean_reason_count_sum'] / checkpoint['mean_reason_count_n'] if checkpoint['mean_reason_count_n'] > 1 else -1,
+                    valid=checkpoint['valid_puzzle_count'] / i * 100,
+                ) + ('' if budget is None else ' // ' + budget.describe(i, checkpoint['good_puzzle_count'])))
+            return new_puzzles
+
+        def compact_seen_candidates():
+            """
+            Moves the seen candidates into a `BloomFilter` once there are too many to keep exactly, sized for as many
+            more as the rest of the run is expected to see at the rates measured so far.
+            """
+            seen = checkpoint['seen_candidates']
+            if not isinstance(seen, set) or len(seen) <= self.bloom_filter_threshold:
+                return
+            expected_candidate_count = stop
+            if budget is not None:
+                candidate_rate = budget.get_rates(checkpoint['candidate_count'], checkpoint['good_puzzle_count'])[0]
+                eta = budget.get_eta(checkpoint['candidate_count'], checkpoint['good_puzzle_count'])
+                expected_candidate_count = min(stop, checkpoint['candidate_count'] + int(candidate_rate * (
+                    eta if eta is not None else budget.get_elapsed())))
+            seen_per_candidate = len(seen) / max(1, checkpoint['candidate_count'])
+            bloom_filter = BloomFilter(max(2 * len(seen), int(expected_candidate_count * seen_per_candidate)))
+            for fingerprint in seen:
+                bloom_filter.add(fingerprint)
+            checkpoint['seen_candidates'] = bloom_filter
+
+        def save_progress():
+            checkpoint['elapsed_seconds'] = time.monotonic() - start_time
+            if found_file is not None:
+                # Every puzzle yielded so far has been written, since the caller asked for the next one.
+                found_file.flush()
+                checkpoint['found_file_offset'] = found_file.tell()
+            self.save_checkpoint(checkpoint_path, checkpoint)
+
+        def finish_batch(batch_index):
+            checkpoint['completed_batches'].add(batch_index)
+            if checkpoint_path and len(checkpoint['completed_batches']) % checkpoint_every == 0:
+                save_progress()
+
+        if workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {}
+
+                def submit_next_batch():
+                    for index, batch_seed, size in itertools.islice(remaining_batches, 1):
+                        futures[executor.submit(self.generate_puzzle_batch, batch_seed, size, EXTRA_INFO)] = index
+
+                # Only a couple of batches per worker are queued at a time, so a spent budget stops the run promptly.
+                for _ in range(2 * workers):
+                    submit_next_batch()
+                while futures:
+                    done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        yield from merge_batch(future.result())
+                        finish_batch(futures.pop(future))
+                        if not is_budget_spent():
+                            submit_next_batch()
+        else:
+            for index, batch_seed, size in remaining_batches:
+                if is_budget_spent():
+                    break
+                yield from merge_batch(self.generate_puzzle_batch(
+                    batch_seed, size, EXTRA_INFO, seen=checkpoint['seen_candidates']))
+                compact_seen_candidates()
+                finish_batch(index)
+        if checkpoint_path:
+            save_progress()
+        time.sleep(0.5)  # Give progress bar time to update.
+        progress.disable = True
 
-            puzzle = Puzzle({
-                self.possible_names[0]: IfConnective(
-                    Not(Biconditional(s[0], s[1])),
-                    Biconditional(s[2], s[3]),
-                ),
-                self.possible_names[1]: IfConnective(
-                    Biconditional(s[4], s[5]),
-                    Not(Biconditional(s[6], s[7])),
-                ),
-                self.possible_names[2]: IfConnective(
-                    Not(Biconditional(s[8], s[9])),
-                    Biconditional(s[10], s[11]),
-                ),
-                self.possible_names[3]: IfConnective(
-                    Biconditional(s[12], Not(s[13])),
-                    Not(Biconditional(s[14], Not(s[15]))),
-                ),
-            })
-            # for name, help_count in puzzle.get_character_helpfulness_hist().items():
-            #     helpfulness[name].append(help_count)
+    def _keep_good_puzzle(self, puzzle: Puzzle) -> bool:
+        """
+        Counts a good puzzle into the current run and offers it to `top_puzzles`.  Returns False, doing nothing, if the
+        run has already found the same puzzle.
+        """
+        checkpoint = self.checkpoint
+        key = puzzle.get_fingerprint_if_stable()
+        if key is not None:
+            if key in checkpoint['seen_puzzles']:
+                return False
+            checkpoint['seen_puzzles'].add(key)
+        checkpoint['good_puzzle_count'] += 1
+        entry = (puzzle.get_score(), checkpoint['good_puzzle_count'], puzzle)
+        if self.top_k is None or len(self.top_puzzles) < self.top_k:
+            heapq.heappush(self.top_puzzles, entry)
+        elif self.top_puzzles[0] < entry:
+            heapq.heapreplace(self.top_puzzles, entry)
+        return True
 
-            if not puzzle.is_valid_puzzle():
-                continue
-            valid_puzzle_count += 1
+    def _start_search_run(self):
+        """
+        Fresh counters for a run of one of the in-process search modes, in the same form `iter_good_puzzles` keeps.
+        """
+        self.checkpoint = {
+            'candidate_count': 0,
+            'valid_puzzle_count': 0,  # A valid puzzle has 0, 1, or 2 solutions.
+            'good_puzzle_count': 0,
+            'duplicate_count': 0,
+            'seen_puzzles': set(),  # Fingerprints of the good puzzles.
+            'top_puzzles': [],
+        }
+        self.top_puzzles = self.checkpoint['top_puzzles']
+
+    def get_energy(self, puzzle: Puzzle) -> float:
+        """
+        How far a candidate is from being a good puzzle, for `iter_good_puzzles_by_annealing` to minimize.
 
-            #################################################
-            # Restrictions to hopefully make puzzle harder. #
-            #################################################
+        Candidates without exactly two solutions are ranked by their distance from two solutions.  Those with two are
+        ranked by the solutions without the most Monks plus the characters that are the same in both.  Good puzzles
+        land below zero, ranked by `get_score`.
+        """
+        solution_count = puzzle.count_solutions(limit=6)
+        if solution_count != 2:
+            return 3 * abs(solution_count - 2)
+        scenarios = tuple(puzzle.get_consistent_scenario_set())
+        without_maximum_monks = sum(
+            sum(kind == Monk for kind in scenario.types()) != puzzle.max_num_monks for scenario in scenarios)
+        same_count = sum(scenarios[0].type_of(name) == scenarios[1].type_of(name) for name in puzzle.character_names)
+        if without_maximum_monks or same_count:
+            return without_maximum_monks + same_count
+        return -1 - puzzle.get_score() / (puzzle.num_characters + 1)
+
+    def iter_good_puzzles_by_annealing(self, steps=None, seed=None, start_temperature=1.0, end_temperature=0.1,
+                                       restart_after=500, budget=None):
+        """
+        Yields each new good puzzle found by simulated annealing over the statement slots of `make_puzzle`, instead of
+        sampling every candidate independently.
+
+        Each step replaces one slot with a statement not already used, or swaps two slots if every statement is, and
+        keeps the change by the Metropolis rule on `get_energy`, as the temperature cools geometrically.  Only a
+        candidate that was just moved to is offered as a good puzzle.  Since the puzzles share one space, each step only
+        re-evaluates the speaker whose statement changed.
+
+        :param steps: How many candidates to check.  Defaults to as many as `iter_good_puzzles` would sample, or to no
+            limit with a `budget`.
+        :param restart_after: Starts over from a fresh random draw after this many steps without a new best energy.
+        :param budget: A `SearchBudget` to stop on.  The temperature then cools with the fraction of it spent.
+        """
+        statements = self.generate_possible_statements()
+        if steps is None and budget is None:
+            total_count = math.factorial(len(statements)) // math.factorial(len(statements) - self.statements_needed)
+            steps = int(total_count * self.early_break)
+        if seed is None:
+            seed = random.getrandbits(64)
+        rng = random.Random(seed)
+        self.get_scenario_space()
+        self._start_search_run()
+        if budget is not None:
+            budget.start()
+        progress = tqdm(total=steps, smoothing=0.15)
+
+        def get_cooled_fraction():
+            fraction = 0.0
+            if steps is not None:
+                fraction = (self.checkpoint['candidate_count'] - 1) / max(1, steps - 1)
+            if budget is not None:
+                fraction = max(fraction, budget.get_progress(self.checkpoint['good_puzzle_count']))
+            return fraction
+
+        def evaluate(slots):
+            puzzle = self.make_puzzle(slots)
+            self.checkpoint['candidate_count'] += 1
+            if puzzle.is_valid_puzzle():
+                self.checkpoint['valid_puzzle_count'] += 1
+            return puzzle, self.get_energy(puzzle)
+
+        current_slots = rng.sample(statements, self.statements_needed)
+        current, current_energy = evaluate(current_slots)
+        best_energy = current_energy
+        steps_since_best = 0
+        is_new = True  # Whether `current` changed since it was last offered as a good puzzle.
+        while True:
+            if is_new and current_energy < 0 and self.is_good_puzzle(current):
+                if self._keep_good_puzzle(current):
+                    yield current
+                else:
+                    self.checkpoint['duplicate_count'] += 1
+            if steps is not None and self.checkpoint['candidate_count'] >= steps:
+                break
+            if budget is not None and budget.is_spent(self.checkpoint['good_puzzle_count']):
+                break
+            temperature = start_temperature * (end_temperature / start_temperature) ** get_cooled_fraction()
+            if steps_since_best >= restart_after:
+                current_slots = rng.sample(statements, self.statements_needed)
+                current, current_energy = evaluate(current_slots)
+                best_energy = current_energy
+                steps_since_best = 0
+                is_new = True
+            else:
+                slots = list(current_slots)
+                used = set(slots)
+                unused = [statement for statement in statements if statement not in used]
+                if unused:
+                    slots[rng.randrange(len(slots))] = rng.choice(unused)
+                elif len(slots) < 2:
+                    break  # There is no other candidate to move to.
+                else:
+                    # Every statement is in use, so the only moves left swap two slots.
+                    i, j = rng.sample(range(len(slots)), 2)
+                    slots[i], slots[j] = slots[j], slots[i]
+                puzzle, energy = evaluate(slots)
+                is_new = energy <= current_energy or rng.random() < math.exp((current_energy - energy) / temperature)
+                if is_new:
+                    current_slots, current, current_energy = slots, puzzle, energy
+                steps_since_best += 1
+                if current_energy < best_energy:
+                    best_energy = current_energy
+                    steps_since_best = 0
+            progress.update(1)
+            if self.checkpoint['candidate_count'] % 256 == 0:
+                description = '{} good // energy {:0.2f} // {:0.2f} degrees'.format(
+                    self.checkpoint['good_puzzle_count'], current_energy, temperature)
+                if budget is not None:
+                    description += ' // ' + budget.describe(
+                        self.checkpoint['candidate_count'], self.checkpoint['good_puzzle_count'])
+                progress.set_description(description)
+        progress.close()
+
+    def get_consistency_tables(self) -> List[Tuple[str, Statement, int]]:
+        """
+        For every character and possible statement, the bitmask of scenarios in which that character could say it.
+        """
+        if self._consistency_tables is None:
+            space = self.get_scenario_space()
+            self._consistency_tables = [
+                (name, statement, statement.evaluate_consistency_table(name, space))
+                for name in self.possible_names
+                for statement in self.generate_possible_statements()
+            ]
+        return self._consistency_tables
+
+    def build_puzzle(self, rng: random.Random, max_statements_per_character=3, choices=3):
+        """
+        Builds a good puzzle one statement at a time instead of sampling whole puzzles.
 
-            if not (puzzle.get_solution_count() == 2
-                    and puzzle.has_maximum_monks(for_exactly_how_many_consistent_scenarios=2)):
-                continue
+        Two target solutions are drawn first: scenarios with the most Monks that differ in every character.  Starting
+        from no statements, where every scenario is consistent, each step adds the statement that keeps both targets
+        consistent while ruling out the most other scenarios, picked at random among the best `choices` of them.  It
+        stops once only the targets are left.
 
-            # Make sure each character says something fairly significant.
-            # if not puzzle.has_optimal_reason_distribution():
-            #     continue
-            if EXTRA_INFO:
-                mean_reason_count = statistics.mean(puzzle.get_reason_counts_per_scenario())
-                mean_reason_counts.append(mean_reason_count)
-
-            scenarios = tuple(puzzle.get_consistent_scenario_set())
-            # type: [Scenario]
-            sol_a = scenarios[0].character_types
-            sol_b = scenarios[1].character_types
-            difference = 0
-            for name in sol_a.keys():
-                if sol_a[name] != sol_b[name]:
-                    difference += 1
-            # Make sure all characters differ in both solutions.  (To hopefully result in more difficult puzzles.)
-            allowed_character_variance = 0
-            if difference < len(puzzle.character_names) - allowed_character_variance:
+        :returns: The puzzle, or None if the statements ran out before only the targets were left.
+        """
+        space = self.get_scenario_space()
+        names = self.possible_names
+        with_maximum_monks = space.count_masks((Monk,))[space.max_num_monks]
+        first = rng.choice(list(iter_mask_indexes(with_maximum_monks)))
+        first_types = space.scenario(puzzle=None, index=first).character_types
+        differing = with_maximum_monks
+        for name in names:
+            differing &= ~space.type_mask(name, first_types[name])
+        if differing == 0:
+            return None
+        second = rng.choice(list(iter_mask_indexes(differing)))
+        targets = (1 << first) | (1 << second)
+
+        consistent = space.full_mask
+        chosen = {name: [] for name in names}
+        while consistent != targets:
+            remaining_count = popcount(consistent)
+            options = []
+            for name, statement, table in self.get_consistency_tables():
+                if table & targets != targets or len(chosen[name]) >= max_statements_per_character:
+                    continue
+                remaining = popcount(consistent & table)
+                if remaining < remaining_count and statement not in chosen[name]:
+                    options.append((remaining, rng.random(), name, statement, table))
+            if not options:
+                return None
+            remaining, _, name, statement, table = rng.choice(sorted(options)[:choices])
+            chosen[name].append(statement)
+            consistent &= table
+        return Puzzle(chosen, engine=self.engine, space=space)
+
+    def iter_good_puzzles_by_construction(self, attempts=1000, seed=None, budget=None):
+        """
+        Yields each new puzzle from `attempts` runs of `build_puzzle`.  Every puzzle it builds is good by construction.
+
+        :param attempts: How many puzzles to try building, or None to keep going until the `budget` is spent.
+        :param budget: A `SearchBudget` to stop on, if it's spent before the attempts run out.
+        """
+        if seed is None:
+            seed = random.getrandbits(64)
+        rng = random.Random(seed)
+        self._start_search_run()
+        if budget is not None:
+            budget.start()
+        progress = tqdm(total=attempts, smoothing=0.15)
+        for attempt in itertools.count():
+            if attempt == attempts or (budget is not None and budget.is_spent(self.checkpoint['good_puzzle_count'])):
+                break
+            progress.update(1)
+            if budget is not None and attempt % 16 == 0:
+                progress.set_description(
+                    budget.describe(self.checkpoint['candidate_count'], self.checkpoint['good_puzzle_count']))
+            puzzle = self.build_puzzle(rng)
+            if puzzle is None:
                 continue
-            good_puzzles.append(puzzle)
+            self.checkpoint['candidate_count'] += 1
+            self.checkpoint['valid_puzzle_count'] += 1
+            if self._keep_good_puzzle(puzzle):
+                yield puzzle
+            else:
+                self.checkpoint['duplicate_count'] += 1
+        progress.close()
 
-        update_progress()
-        time.sleep(0.5)  # Give progress bar time to update.
-        progress.disable = True
-        print('\n', len(good_puzzles), 'good puzzles found of', i)
-        print('valid count', valid_puzzle_count)
-        sorted_good_puzzles = sorted(good_puzzles)
+    def iter_good_puzzles_exhaustively(self, limit=None, budget=None):
+        """
+        Yields each new good puzzle among the candidates of `make_puzzle`, walking them in an order where consecutive
+        steps differ in a single statement slot (see `iter_arrangement_changes`) instead of sampling them.  Unless a
+        `limit` or `budget` stops it first, every candidate is checked exactly once.
+
+        Only the speaker whose slot changed has its consistency mask recomputed, and the puzzle's consistent scenarios
+        are the AND of the speakers' masks.  Only candidates with exactly two of them are built into a `Puzzle`.  The
+        occasional step that uses a statement twice is passed over without being counted as a candidate.
+
+        :param limit: How many candidates to check.  Defaults to all of them.
+        :param budget: A `SearchBudget` to stop on, if it's spent before the candidates run out.
+        """
+        statements = self.generate_possible_statements()
+        slot_count = self.statements_needed
+        if limit is None:
+            limit = math.factorial(len(statements)) // math.factorial(len(statements) - slot_count)
+        shared_space = self.get_scenario_space()
+        # Only this walk's own memo grows with the statements it builds, and it's cleared whenever it gets large.
+        space = shared_space.fork()
+        self._start_search_run()
+        if budget is not None:
+            budget.start()
+        per_speaker = self.slots_per_speaker
+        speaker_names = self.possible_names[:slot_count // per_speaker]
+        choices = list(range(slot_count))  # Indexes into `statements`.
+        uses = [1] * slot_count + [0] * (len(statements) - slot_count)
+        repeat_count = 0  # Slots holding a statement already held by another slot.
+        masks = [None] * len(speaker_names)  # None for a speaker whose slots changed since its mask was computed.
+        progress = tqdm(total=limit, smoothing=0.15)
+
+        def speaker_mask(index):
+            name = speaker_names[index]
+            statement = self.make_statement(
+                index, [statements[choice] for choice in choices[index * per_speaker:(index + 1) * per_speaker]])
+            key = (name, (statement,))
+            mask = shared_space.speaker_masks.get(key)
+            if mask is None:
+                mask = statement.evaluate_consistency_table(name, space)
+                shared_space.speaker_masks.put(key, mask)
+            return mask
+
+        changes = iter_arrangement_changes(len(statements), slot_count)
+        while self.checkpoint['candidate_count'] < limit:
+            if repeat_count == 0:
+                if budget is not None and budget.is_spent(self.checkpoint['good_puzzle_count']):
+                    break
+                self.checkpoint['candidate_count'] += 1
+                consistent = space.full_mask
+                for index in range(len(masks)):
+                    if masks[index] is None:
+                        masks[index] = speaker_mask(index)
+                    consistent &= masks[index]
+                    if not consistent:
+                        break
+                solution_count = popcount(consistent)
+                if solution_count <= SOLUTION_COUNT_BOUND[1]:
+                    self.checkpoint['valid_puzzle_count'] += 1
+                if solution_count == 2:
+                    puzzle = self.make_puzzle([statements[choice] for choice in choices])
+                    if self.is_good_puzzle(puzzle):
+                        if self._keep_good_puzzle(puzzle):
+                            yield puzzle
+                        else:
+                            self.checkpoint['duplicate_count'] += 1
+                progress.update(1)
+                if budget is not None and self.checkpoint['candidate_count'] % 4096 == 0:
+                    progress.set_description(
+                        budget.describe(self.checkpoint['candidate_count'], self.checkpoint['good_puzzle_count']))
+                if space.memo_size() > self.exhaustive_memo_size:
+                    space.clear_memo()
+            change = next(changes, None)
+            if change is None:
+                break
+            slot, choice = change
+            old_choice = choices[slot]
+            uses[old_choice] -= 1
+            if uses[old_choice]:
+                repeat_count -= 1
+            if uses[choice]:
+                repeat_count += 1
+            uses[choice] += 1
+            choices[slot] = choice
+            masks[slot // per_speaker] = None
+        progress.close()
+
+    @staticmethod
+    def write_puzzle_record(puzzle: Puzzle, file=None):
+        print(puzzle.get_character_statements_as_string(), file=file)
+        print(puzzle.code_repr(), file=file)
+        print('Solutions:', puzzle.get_consistent_scenario_set(), file=file)
+        puzzle.print_puzzle_statistics(file=file)
+        print('', file=file)
+
+    def get_top_puzzles(self) -> List[Puzzle]:
+        """
+        The best puzzles found so far, best first.
+        """
+        return [puzzle for score, order, puzzle in sorted(self.top_puzzles, reverse=True)]
+
+    def generate_puzzles(self, to_file=True, workers=1, seed=None, checkpoint_path=None, checkpoint_every=20,
+                         search=SEARCH_RANDOM, seconds=None, good_puzzle_count=None, limit=None):
+        """
+        Writes each good puzzle to `good_puzzles_found.txt` as it is found, then writes the best `top_k`, best first,
+        to `good_puzzles_auto.txt`.  See `iter_good_puzzles` for the parameters.  A run resumed from a checkpoint keeps
+        the `good_puzzles_found.txt` of the run it continues, and every other run starts the file over.
+
+        :param search: `SEARCH_RANDOM` to sample candidates independently, `SEARCH_ANNEALING` for
+            `iter_good_puzzles_by_annealing`, `SEARCH_CONSTRUCTIVE` for `iter_good_puzzles_by_construction`, or
+            `SEARCH_EXHAUSTIVE` for `iter_good_puzzles_exhaustively`.  All but the first run in this process and don't
+            checkpoint.
+        :param seconds: Stops after about this much wall-clock time, instead of after `early_break` of all candidates.
+        :param good_puzzle_count: Stops once this many good puzzles have been found.  With `seconds` as well, whichever
+            comes first stops the run.
+        :param limit: How many candidates `SEARCH_EXHAUSTIVE` checks.  Defaults to all of them, however long that takes,
+            unless `seconds` or `good_puzzle_count` stops it first.
+        """
+        if search != SEARCH_RANDOM and (workers != 1 or checkpoint_path):
+            raise ValueError("The {} search runs in one process without checkpoints.".format(search))
+        if limit is not None and search != SEARCH_EXHAUSTIVE:
+            raise ValueError("Only the {} search takes a limit.".format(SEARCH_EXHAUSTIVE))
+        budget = None
+        if seconds is not None or good_puzzle_count is not None:
+            budget = SearchBudget(seconds=seconds, good_puzzle_count=good_puzzle_count)
+        found_file = None
+        if to_file:
+            # Only `iter_good_puzzles` can resume, and it decides how much of the file to keep.
+            found_file = open(os.path.join(os.path.curdir, 'good_puzzles_found.txt'),
+                              'a' if search == SEARCH_RANDOM else 'w')
+        if search == SEARCH_ANNEALING:
+            puzzles = self.iter_good_puzzles_by_annealing(seed=seed, budget=budget)
+        elif search == SEARCH_CONSTRUCTIVE:
+            puzzles = self.iter_good_puzzles_by_construction(
+                attempts=None if budget is not None else 1000, seed=seed, budget=budget)
+        elif search == SEARCH_EXHAUSTIVE:
+            puzzles = self.iter_good_puzzles_exhaustively(limit=limit, budget=budget)
+        else:
+            puzzles = self.iter_good_puzzles(
+                workers=workers, seed=seed, checkpoint_path=checkpoint_path, checkpoint_every=checkpoint_every,
+                budget=budget, found_file=found_file)
+        try:
+            for puzzle in puzzles:
+                if found_file is not None:
+                    self.write_puzzle_record(puzzle, file=found_file)
+                    found_file.flush()
+        finally:
+            if found_file is not None:
+                found_file.close()
+
+        print('\n', self.checkpoint['good_puzzle_count'], 'good puzzles found of', self.checkpoint['candidate_count'])
+        print('valid count', self.checkpoint['valid_puzzle_count'])
+        print('duplicate candidates skipped', self.checkpoint['duplicate_count'])
+        if budget is not None:
+            candidate_rate, good_rate = budget.get_rates(
+                self.checkpoint['candidate_count'], self.checkpoint['good_puzzle_count'])
+            print('{:0.1f}s elapsed // {:0.0f} candidates/s // {:0.2f} good/s'.format(
+                budget.get_elapsed(), candidate_rate, good_rate))
         if to_file:
             f = open(os.path.join(os.path.curdir, 'good_puzzles_auto.txt'), 'w')
         else:
             f = None
-        for puzzle in reversed(sorted_good_puzzles):
-            print(puzzle.get_character_statements_as_string(), file=f)
-            print(puzzle.code_repr(), file=f)
-            print('Solutions:', puzzle.get_consistent_scenario_set(), file=f)
-            puzzle.print_puzzle_statistics(file=f)
-            print('', file=f)
-        f.close()
+        for puzzle in self.get_top_puzzles():
+            self.write_puzzle_record(puzzle, file=f)
+        if f is not None:
+            f.close()
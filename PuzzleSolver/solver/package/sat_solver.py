@@ -0,0 +1,135 @@
+from typing import List, Dict
+
+
+class SatSolver:
+    """
+    A small DPLL solver with two watched literals and unit propagation.
+
+    Variables are positive integers and a literal is a variable or its negation, as in DIMACS.
+    """
+    def __init__(self):
+        self.num_vars = 0
+        self.clauses = []  # type: List[List[int]]
+        self.units = []  # type: List[int]
+        self.watches = {}  # type: Dict[int, List[int]]
+        self.is_unsatisfiable = False
+
+    def new_var(self) -> int:
+        self.num_vars += 1
+        return self.num_vars
+
+    def add_clause(self, literals):
+        clause = []
+        for literal in literals:
+            if -literal in clause:
+                return  # Tautology.
+            if literal not in clause:
+                clause.append(literal)
+        if len(clause) == 0:
+            self.is_unsatisfiable = True
+        elif len(clause) == 1:
+            self.units.append(clause[0])
+        else:
+            index = len(self.clauses)
+            self.clauses.append(clause)
+            self.watches.setdefault(clause[0], []).append(index)
+            self.watches.setdefault(clause[1], []).append(index)
+
+    def solve(self):
+        """
+        :returns: A satisfying assignment as a list indexed by variable, or None if there is none.
+        """
+        if self.is_unsatisfiable:
+            return None
+        values = [None] * (self.num_vars + 1)
+        trail = []
+
+        def value(literal):
+            v = values[abs(literal)]
+            return None if v is None else v == (literal > 0)
+
+        def assign(literal):
+            values[abs(literal)] = literal > 0
+            trail.append(literal)
+
+        def propagate(start):
+            """
+            Applies unit propagation to everything on the trail from `start` on.  Returns False on a conflict.
+            """
+            i = start
+            while i < len(trail):
+                false_literal = -trail[i]
+                i += 1
+                watching = self.watches.get(false_literal, [])
+                j = 0
+                while j < len(watching):
+                    clause = self.clauses[watching[j]]
+                    if clause[0] == false_literal:
+                        clause[0], clause[1] = clause[1], clause[0]
+                    if value(clause[0]) is True:
+                        j += 1
+                        continue
+                    for k in range(2, len(clause)):
+                        if value(clause[k]) is not False:
+                            # Moves the watch from `false_literal` onto a literal that is not yet false.
+                            clause[1], clause[k] = clause[k], clause[1]
+                            self.watches.setdefault(clause[1], []).append(watching[j])
+                            watching[j] = watching[-1]
+                            watching.pop()
+                            break
+                    else:
+                        if value(clause[0]) is False:
+                            return False
+                        assign(clause[0])
+                        j += 1
+            return True
+
+        def undo(size):
+            for literal in trail[size:]:
+                values[abs(literal)] = None
+            del trail[size:]
+
+        for literal in self.units:
+            if value(literal) is False:
+                return None
+            if value(literal) is None:
+                assign(literal)
+        if not propagate(0):
+            return None
+
+        decisions = []  # (trail size before the decision, decided variable, whether it has been flipped)
+        while True:
+            var = next((v for v in range(1, self.num_vars + 1) if values[v] is None), None)
+            if var is None:
+                return values
+            decisions.append((len(trail), var, False))
+            assign(var)
+            is_ok = propagate(len(trail) - 1)
+            while not is_ok:
+                while decisions and decisions[-1][2]:
+                    decisions.pop()
+                if not decisions:
+                    return None
+                size, var, _ = decisions.pop()
+                undo(size)
+                decisions.append((size, var, True))
+                assign(-var)
+                is_ok = propagate(size)
+
+    def iter_models(self, projection: List[int]):
+        """
+        Yields each distinct assignment of the `projection` variables that extends to a model, as {var: bool}.
+
+        Models are found one at a time, so a caller that only needs a few of them can stop early.
+        """
+        projection = list(projection)
+        while True:
+            values = self.solve()
+            if values is None:
+                return
+            model = {var: values[var] for var in projection}
+            yield model
+            # Blocks this assignment so the next solve has to find a different one.
+            self.add_clause([-var if model[var] else var for var in projection])
+            if not projection:
+                return
@@ -0,0 +1,84 @@
+import json
+import os
+import sqlite3
+
+
+class SolveCache:
+    """
+    Solve results stored in a SQLite file, keyed by puzzle fingerprint and evicted least recently used first once
+    there are more than `max_entries`.
+
+    Results are JSON-serializable dicts.  The connection is opened lazily in each process, so one cache can be shared
+    with worker processes forked after it was created.
+    """
+    def __init__(self, path, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._connection_pid = None
+        self._entry_count = None
+        self._clock = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None or self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=30)
+            self._connection_pid = os.getpid()
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS solves (fingerprint TEXT PRIMARY KEY, result TEXT, last_used INTEGER)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS solves_last_used ON solves (last_used)')
+            self._connection.commit()
+            self._entry_count = None
+            self._clock = None
+        return self._connection
+
+    def _tick(self) -> int:
+        """
+        A use counter that orders entries for eviction, carried on from the newest entry in the file.
+        """
+        connection = self._connect()
+        if self._clock is None:
+            self._clock = connection.execute('SELECT COALESCE(MAX(last_used), 0) FROM solves').fetchone()[0]
+        self._clock += 1
+        return self._clock
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM solves').fetchone()[0]
+
+    def get(self, fingerprint: str):
+        connection = self._connect()
+        row = connection.execute('SELECT result FROM solves WHERE fingerprint = ?', (fingerprint,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        connection.execute('UPDATE solves SET last_used = ? WHERE fingerprint = ?', (self._tick(), fingerprint))
+        connection.commit()
+        return json.loads(row[0])
+
+    def put(self, fingerprint: str, result):
+        connection = self._connect()
+        if self._entry_count is None:
+            self._entry_count = len(self)
+        cursor = connection.execute(
+            'INSERT OR IGNORE INTO solves (fingerprint, result, last_used) VALUES (?, ?, ?)',
+            (fingerprint, json.dumps(result), self._tick()))
+        self._entry_count += cursor.rowcount
+        if self._entry_count > self.max_entries:
+            connection.execute(
+                'DELETE FROM solves WHERE fingerprint IN (SELECT fingerprint FROM solves ORDER BY last_used LIMIT ?)',
+                (self._entry_count - self.max_entries,))
+            self._entry_count = self.max_entries
+        connection.commit()
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def clear(self):
+        connection = self._connect()
+        connection.execute('DELETE FROM solves')
+        connection.commit()
+        self._entry_count = 0
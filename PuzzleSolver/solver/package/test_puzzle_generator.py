@@ -1,7 +1,19 @@
 import unittest
 import operator
+import itertools
+import contextlib
+import io
+import os
+import tempfile
+import statistics
+import pickle
+import hashlib
+import re
+import sys
 
 from package.puzzle_generator import *
+from package.sat_solver import SatSolver
+from package.solve_cache import SolveCache
 
 
 class TestIsOfTypeStatement(unittest.TestCase):
@@ -53,6 +65,35 @@ class TestCharacterConsistency(unittest.TestCase):
         self.assertTrue(self.false_statement.evaluate_consistency(Monk, self.s))
 
 
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self.scenario = Scenario(puzzle=None, character_types={'A': Knave, 'B': Knight})
+        self.statement = ConjunctiveStatement(IsOfType('A', Knave), IsOfType('B', Knave))
+
+    def tearDown(self):
+        tracer.disable()
+        tracer.clear()
+
+    def test_disabled_records_nothing(self):
+        self.statement.evaluate_consistency(Knight, self.scenario)
+        self.assertEqual(len(tracer.events), 0)
+
+    def test_records_structured_events(self):
+        tracer.enable()
+        self.assertTrue(self.statement.evaluate_consistency(Knave, self.scenario))
+        self.assertEqual(list(tracer.events), [
+            (TRACE_TRUTH, self.statement, None, False, None),
+            (TRACE_CONSISTENCY, self.statement, None, True, Knave),
+        ])
+        self.assertEqual(len(list(tracer.iter_formatted_events())), 2)
+
+    def test_ring_buffer_is_bounded(self):
+        tracer.enable(capacity=3)
+        for _ in range(5):
+            self.statement.evaluate_consistency(Knight, self.scenario)
+        self.assertEqual(len(tracer.events), 3)
+
+
 class TestConnectives(unittest.TestCase):
     def test_bob(self):
         s = Scenario(puzzle=None, character_types={
@@ -148,10 +189,165 @@ class TestBasicPuzzleElements(unittest.TestCase):
         self.assertEqual(p.max_num_monks, 0)
 
 
+class TestStatementInterning(unittest.TestCase):
+    def test_identical_statements_are_one_object(self):
+        self.assertIs(IsOfType('A', Knight), IsOfType(target_name='A', claimed_character_type=Knight))
+        self.assertIs(
+            Biconditional(Honesty('A', 'B', operator.le), Not(IsSameAs('A', 'B'))),
+            Biconditional(Honesty('A', 'B', operator.le), Not(IsSameAs('A', 'B'))),
+        )
+        self.assertIs(ConjunctiveStatement(), ConjunctiveStatement())
+        self.assertIs(AllTheSame(), AllTheSame())
+
+    def test_different_statements(self):
+        self.assertIsNot(IsOfType('A', Knight), IsOfType('A', Knave))
+        self.assertNotEqual(IsOfType('A', Knight), IsOfType('A', Knave))
+        self.assertNotEqual(ConjunctiveStatement(IsOfType('A', Knight)), DisjunctiveStatement(IsOfType('A', Knight)))
+
+    def test_statements_are_immutable(self):
+        with self.assertRaises(AttributeError):
+            IsOfType('A', Knight).target_name = 'B'
+
+    def test_pickling_reinterns(self):
+        statement = IfConnective(CountOfType(Monk, 1, operator.le), IsOfType('A', Knave))
+        self.assertIs(pickle.loads(pickle.dumps(statement)), statement)
+
+    def test_reasons_hash_by_statement(self):
+        self.assertEqual(Reason('A', IsSameAs('A', 'B')), Reason('A', IsSameAs('A', 'B')))
+        self.assertEqual(len({Reason('A', IsSameAs('A', 'B')), Reason('A', IsSameAs('A', 'B'))}), 1)
+        self.assertNotEqual(Reason('A', IsSameAs('A', 'B')), Reason('B', IsSameAs('A', 'B')))
+
+
+def iter_scenario_rows(width, max_num_monks):
+    """
+    Yields each row of character codes with at most `max_num_monks` Monks, in the order `ScenarioSpace` indexes them.
+    """
+    monk_code = CHARACTER_CODES[Monk]
+    honest_codes = (CHARACTER_CODES[Knight], CHARACTER_CODES[Knave])
+    for monk_count in range(min(max_num_monks, width) + 1):
+        for monk_columns in itertools.combinations(range(width), monk_count):
+            other_columns = [column for column in range(width) if column not in monk_columns]
+            row = [monk_code] * width
+            for codes in itertools.product(honest_codes, repeat=len(other_columns)):
+                for column, code in zip(other_columns, codes):
+                    row[column] = code
+                yield tuple(row)
+
+
+class TestScenarioSpace(unittest.TestCase):
+    def test_size_respects_max_monks(self):
+        space = ScenarioSpace(['A', 'B', 'C'], max_num_monks=1)
+        # 2^3 without Monks, plus 3 * 2^2 with exactly one Monk.
+        self.assertEqual(len(space), 8 + 12)
+
+    def test_rows_skip_over_monk_assignments(self):
+        monk_code = CHARACTER_CODES[Monk]
+        for width, max_num_monks in [(0, 0), (3, 1), (4, 0), (5, 2), (4, 4)]:
+            rows = list(iter_scenario_rows(width, max_num_monks))
+            expected = [row for row in itertools.product(range(len(CHARACTER_ENCODING)), repeat=width)
+                        if row.count(monk_code) <= max_num_monks]
+            self.assertEqual(sorted(rows), expected)
+            self.assertEqual([row.count(monk_code) for row in rows], sorted(row.count(monk_code) for row in rows))
+
+    def test_rows_and_masks_match_enumeration(self):
+        for width, max_num_monks in [(1, 0), (3, 1), (4, 0), (5, 2), (4, 4)]:
+            names = ['ABCDE'[i] for i in range(width)]
+            space = ScenarioSpace(names, max_num_monks)
+            rows = list(iter_scenario_rows(width, max_num_monks))
+            self.assertEqual(len(space), len(rows))
+            self.assertEqual([space.row(index) for index in range(len(space))], rows)
+            for column, name in enumerate(names):
+                for kind in CHARACTER_ENCODING:
+                    expected = sum(1 << index for index, row in enumerate(rows) if row[column] == CHARACTER_CODES[kind])
+                    self.assertEqual(space.type_mask(name, kind), expected)
+
+    def test_size_without_monks(self):
+        space = ScenarioSpace(['A', 'B', 'C', 'D'], max_num_monks=0)
+        self.assertEqual(len(space), 16)
+
+    def test_encoded_scenario_equals_dict_scenario(self):
+        space = ScenarioSpace(['A', 'B'], max_num_monks=0)
+        for index in range(len(space)):
+            encoded = space.scenario(puzzle=None, index=index)
+            plain = Scenario(puzzle=None, character_types=encoded.character_types)
+            self.assertEqual(encoded, plain)
+            self.assertEqual(hash(encoded), hash(plain))
+
+    def test_encode_is_base_3(self):
+        space = ScenarioSpace(['A', 'B'], max_num_monks=1)
+        codes = {space.encode(index) for index in range(len(space))}
+        self.assertEqual(len(codes), len(space))
+        self.assertTrue(all(0 <= code < 3 ** 2 for code in codes))
+
+    def test_unknown_character(self):
+        space = ScenarioSpace(['A', 'B'], max_num_monks=0)
+        with self.assertRaises(CharacterIdentifierError):
+            IsOfType('C', Knight).evaluate_truth(space.scenario(puzzle=None, index=0))
+
+
+class TestTruthTables(unittest.TestCase):
+    def setUp(self):
+        self.space = ScenarioSpace(['A', 'B', 'C', 'D'], max_num_monks=1)
+
+    def assertTruthTableMatches(self, statement):
+        scenario = self.space.scenario(puzzle=None, index=0)
+        expected = 0
+        for index in range(len(self.space)):
+            scenario.index = index
+            if statement.evaluate_truth(scenario):
+                expected |= 1 << index
+        self.assertEqual(statement.evaluate_truth_table(self.space), expected, statement)
+
+    def test_atoms(self):
+        for statement in [
+            IsOfType('A', Knight),
+            IsOfType('C', Monk),
+            IsSameAs('A', 'D'),
+            Honesty('B', 'C', operator.le),
+            Honesty('B', 'C', operator.gt),
+            CountOfType(Knave, 2, operator.le),
+            CountOfType(Monk, 0, operator.eq),
+            CountOfTypes(Knight, Knave, operator.gt),
+            SumOfTypes((Knave, Monk), 2, operator.eq),
+            AllTheSame(),
+            AllDifferent(),
+            TrueStatement(),
+        ]:
+            self.assertTruthTableMatches(statement)
+
+    def test_combinations(self):
+        a = IsOfType('A', Knave)
+        b = CountOfType(Knight, 2, operator.ge)
+        c = IsSameAs('B', 'C')
+        for statement in [
+            Not(a),
+            ConjunctiveStatement(a, b, c),
+            ConjunctiveStatement(),
+            DisjunctiveStatement(a, b, c),
+            DisjunctiveStatement(),
+            IfConnective(a, b),
+            Biconditional(Not(b), c),
+            ExclusiveOrConnective(a, c),
+        ]:
+            self.assertTruthTableMatches(statement)
+
+    def test_consistency_table(self):
+        statement = IsOfType('A', Knave)
+        table = statement.evaluate_consistency_table('B', self.space)
+        scenario = self.space.scenario(puzzle=None, index=0)
+        for index in range(len(self.space)):
+            scenario.index = index
+            expected = statement.evaluate_consistency(scenario.type_of('B'), scenario)
+            self.assertEqual(bool((table >> index) & 1), expected)
+
+
 class TestPuzzles(unittest.TestCase):
+    engine = ENGINE_TRUTH_TABLE
+
     def assertPuzzleSolution(self, setup, solution_set, allow_monks=True):
-        p = Puzzle(setup, allow_monks=allow_monks)
-        p.solve()
+        p = Puzzle(setup, allow_monks=allow_monks, engine=self.engine)
+        if self.engine == ENGINE_TRUTH_TABLE:
+            p.solve()
         correct_scenarios = set()
         for solution in solution_set:
             correct_scenarios.add(Scenario(puzzle=p, character_types=solution))
@@ -316,4 +512,743 @@ class TestPuzzles(unittest.TestCase):
         }])
 
 
+class TestSymmetry(unittest.TestCase):
+    def make_ring(self, size):
+        # Each character claims to match the next one, so rotating the names maps the puzzle onto itself.
+        names = ['C{}'.format(i) for i in range(size)]
+        return Puzzle({
+            name: [IsSameAs(name, names[(i + 1) % size]), CountOfType(Knave, 2, operator.ge)]
+            for i, name in enumerate(names)
+        })
+
+    def test_renamed(self):
+        statement = IfConnective(IsSameAs('A', 'B'), CountOfType(Monk, 1, operator.le))
+        self.assertIs(
+            statement.renamed({'A': 'B', 'B': 'A'}),
+            IfConnective(IsSameAs('B', 'A'), CountOfType(Monk, 1, operator.le)))
+        self.assertEqual(statement.get_character_names(), {'A', 'B'})
+
+    def test_ring_automorphisms_are_rotations(self):
+        automorphisms = self.make_ring(4).get_automorphisms()
+        self.assertEqual(automorphisms[0], {'C0': 'C0', 'C1': 'C1', 'C2': 'C2', 'C3': 'C3'})
+        self.assertEqual(len(automorphisms), 4)
+        self.assertIn({'C0': 'C1', 'C1': 'C2', 'C2': 'C3', 'C3': 'C0'}, automorphisms)
+
+    def test_asymmetric_puzzle(self):
+        p = Puzzle({'A': IsOfType('B', Knave), 'B': [], 'C': []})
+        self.assertEqual(len(p.get_automorphisms()), 1)
+
+    def test_orbits_are_expanded(self):
+        for p in (self.make_ring(5), Puzzle({'A': [], 'B': [], 'C': []}), Puzzle({
+            'A': AllDifferent(), 'B': AllDifferent(), 'C': CountOfType(Monk, 1, operator.eq), 'D': [],
+        })):
+            expected = set(p.iter_consistent_scenarios_by_backtracking(use_symmetry=False))
+            self.assertEqual(expected, p.get_consistent_scenario_set())
+            backtracked = list(p.iter_consistent_scenarios_by_backtracking())
+            self.assertEqual(len(backtracked), len(expected))
+            self.assertEqual(set(backtracked), expected)
+            found = list(p.iter_consistent_scenarios_by_sat())
+            self.assertEqual(len(found), len(expected))
+            self.assertEqual(set(found), expected)
+
+
+class TestFingerprint(unittest.TestCase):
+    def test_renaming_and_commutative_operands(self):
+        p = Puzzle({
+            'A': [Biconditional(IsSameAs('A', 'B'), IsOfType('C', Monk))],
+            'B': [ConjunctiveStatement(IsOfType('A', Knave), CountOfType(Knight, 1, operator.ge))],
+            'C': [],
+        })
+        q = Puzzle({
+            'X': [ConjunctiveStatement(CountOfType(Knight, 1, operator.ge), IsOfType('Y', Knave))],
+            'Y': [Biconditional(IsOfType('Z', Monk), IsSameAs('X', 'Y'))],
+            'Z': [],
+        })
+        self.assertEqual(p.get_canonical_form(), q.get_canonical_form())
+        self.assertEqual(p.get_fingerprint(), q.get_fingerprint())
+
+    def test_different_puzzles(self):
+        p = Puzzle({'A': IfConnective(IsOfType('B', Knave), AllTheSame()), 'B': [], 'C': []})
+        q = Puzzle({'A': IfConnective(AllTheSame(), IsOfType('B', Knave)), 'B': [], 'C': []})
+        self.assertNotEqual(p.get_fingerprint(), q.get_fingerprint())
+        self.assertNotEqual(p.get_fingerprint(), Puzzle({'A': IsOfType('A', Knave), 'B': [], 'C': []}).get_fingerprint())
+        self.assertNotEqual(p.get_fingerprint(), Puzzle(
+            {'A': IfConnective(IsOfType('B', Knave), AllTheSame()), 'B': [], 'C': []}, allow_monks=False
+        ).get_fingerprint())
+
+    def test_relations_without_stable_names(self):
+        equal = Puzzle({'A': CountOfType(Knight, 1, lambda a, b: a == b), 'B': [], 'C': []})
+        unequal = Puzzle({'A': CountOfType(Knight, 1, lambda a, b: a != b), 'B': [], 'C': []})
+        for puzzle in (equal, unequal):
+            with self.assertRaises(ValueError):
+                puzzle.get_fingerprint()
+            self.assertIsNone(puzzle.get_fingerprint_if_stable())
+        self.assertNotEqual(
+            Puzzle({'A': CountOfType(Knight, 1, operator.eq), 'B': [], 'C': []}).get_fingerprint(),
+            Puzzle({'A': CountOfType(Knight, 1, operator.ne), 'B': [], 'C': []}).get_fingerprint(),
+        )
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000)
+        digests = [hashlib.sha1(str(i).encode()).hexdigest() for i in range(2000)]
+        for digest in digests[:1000]:
+            bloom.add(digest)
+        self.assertTrue(all(digest in bloom for digest in digests[:1000]))
+        false_positives = sum(digest in bloom for digest in digests[1000:])
+        self.assertLess(false_positives, 20)
+
+    def test_generator_skips_seen_candidates(self):
+        gen = PuzzleGenerator(['A', 'B', 'C', 'D'], [IsSameAs, CountOfType, Honesty])
+        seen = set()
+        first = gen.generate_puzzle_batch(seed=11, candidate_count=200, seen=seen)
+        again = gen.generate_puzzle_batch(seed=11, candidate_count=200, seen=seen)
+        self.assertEqual(again.valid_puzzle_count, 0)
+        self.assertEqual(again.good_puzzles, [])
+        self.assertEqual(again.duplicate_count, first.valid_puzzle_count + first.duplicate_count)
+
+    def test_seen_candidates_move_into_bloom_filter(self):
+        gen = PuzzleGenerator(['A', 'B', 'C', 'D'], [IsSameAs, CountOfType, Honesty])
+        gen.early_break = 2.5e-15  # About 1,000 candidates.
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            list(gen.iter_good_puzzles(seed=1))
+        self.assertIsInstance(gen.checkpoint['seen_candidates'], set)
+        gen.bloom_filter_threshold = 50
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            list(gen.iter_good_puzzles(seed=1, budget=SearchBudget(seconds=60, good_puzzle_count=10)))
+        self.assertIsInstance(gen.checkpoint['seen_candidates'], BloomFilter)
+        self.assertGreaterEqual(gen.checkpoint['good_puzzle_count'], 10)
+
+
+class TestSolveCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = SolveCache(os.path.join(self.directory.name, 'solves.sqlite3'), max_entries=2)
+        Puzzle.solve_cache = self.cache
+
+    def tearDown(self):
+        Puzzle.solve_cache = None
+        self.cache.close()
+        self.directory.cleanup()
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.cache.put('c', 3)
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get('c'), 3)
+
+    def test_custom_relations_bypass_cache(self):
+        def make_relation(want_equal):
+            def relation(a, b):
+                return (a == b) == want_equal
+            return relation
+
+        relations = [lambda a, b: a == b, lambda a, b: a != b, make_relation(True), make_relation(False)]
+        puzzles = [Puzzle({'A': CountOfType(Knight, 1, relation), 'B': [], 'C': []}) for relation in relations]
+        for puzzle in puzzles:
+            puzzle.solve()
+        self.assertEqual(self.cache.hits + self.cache.misses, 0)
+        self.assertEqual(len(self.cache), 0)
+        counts = [puzzle.get_solution_count() for puzzle in puzzles]
+        self.assertNotEqual(counts[0], counts[1])
+        self.assertEqual(counts[2:], counts[:2])
+        for puzzle, count in zip(puzzles, counts):
+            self.assertEqual(puzzle.get_solution_count(), count)
+            uncached = Puzzle(dict(puzzle.character_statements))
+            uncached.solve(use_cache=False)
+            self.assertEqual(uncached.get_solution_count(), count)
+
+    def test_renamed_puzzle_hits(self):
+        p = Puzzle({
+            'A': [Biconditional(IsSameAs('A', 'B'), IsOfType('C', Monk))],
+            'B': [CountOfType(Knave, 1, operator.eq)],
+            'C': [],
+        })
+        q = Puzzle({
+            'Z': [],
+            'X': [Biconditional(IsOfType('Z', Monk), IsSameAs('Y', 'X'))],
+            'Y': [CountOfType(Knave, 1, operator.eq)],
+        })
+        p.solve()
+        self.assertEqual(self.cache.misses, 1)
+        q.solve()
+        self.assertEqual(self.cache.hits, 1)
+        self.assertIsNone(q.space)  # Nothing was enumerated.
+        rename = {'A': 'X', 'B': 'Y', 'C': 'Z'}
+        self.assertEqual(
+            {tuple(sorted((rename[name], kind) for name, kind in s.character_types.items())) for s in p.get_consistent_scenario_set()},
+            {tuple(sorted(s.character_types.items())) for s in q.get_consistent_scenario_set()})
+        self.assertEqual(q.get_score(), p.get_score())
+        self.assertEqual(
+            q.number_of_characters_uniquely_eliminating_scenario(),
+            p.number_of_characters_uniquely_eliminating_scenario())
+        # Statistics the cache doesn't keep are solved for when asked.
+        self.assertEqual(sorted(q.get_character_helpfulness_hist().values()), sorted(p.get_character_helpfulness_hist().values()))
+
+
+class TestCountSolutions(unittest.TestCase):
+    def make_puzzle(self, engine):
+        # Nobody says anything, so every scenario is consistent.
+        return Puzzle({'A': [], 'B': [], 'C': []}, engine=engine)
+
+    def test_stops_past_limit(self):
+        for engine in (ENGINE_TRUTH_TABLE, ENGINE_BACKTRACKING, ENGINE_SAT):
+            p = self.make_puzzle(engine)
+            self.assertEqual(p.count_solutions(limit=2), 3)
+            self.assertFalse(p.is_valid_puzzle())
+
+    def test_without_limit(self):
+        for engine in (ENGINE_TRUTH_TABLE, ENGINE_BACKTRACKING, ENGINE_SAT):
+            p = self.make_puzzle(engine)
+            self.assertEqual(p.count_solutions(), 20)
+
+    def test_does_not_solve(self):
+        p = Puzzle({
+            'A': CountOfType(Knave, 3, operator.eq),
+            'B': CountOfType(Knave, 2, operator.eq),
+            'C': [],
+        }, allow_monks=False)
+        self.assertEqual(p.count_solutions(limit=2), 1)
+        self.assertTrue(p.is_valid_puzzle())
+        self.assertFalse(p.is_solved)
+        self.assertEqual(p.get_solution_count(), 1)
+
+
+class TestFastFail(unittest.TestCase):
+    def setUp(self):
+        self.p = Puzzle({
+            'A': [TrueStatement(), IfConnective(IsOfType('B', Knave), AllTheSame())],
+            'B': [IsOfType('A', Knight), CountOfType(Monk, 1, operator.eq)],
+            'C': [Honesty('A', 'C', operator.gt), IsOfType('C', Knave)],
+        })
+
+    def test_agrees_with_full_check(self):
+        for scenario in self.p.iter_scenarios():
+            is_consistent, reasons = self.p.check_scenario(scenario, should_print=False)
+            fast_is_consistent, fast_reasons = self.p.check_scenario(scenario, should_print=False, fast_fail=True)
+            self.assertEqual(fast_is_consistent, is_consistent)
+            self.assertEqual(len(fast_reasons), 0 if is_consistent else 1)
+            self.assertTrue(set(fast_reasons) <= set(reasons))
+
+    def test_checks_selective_statements_first(self):
+        for _ in range(FAST_FAIL_REORDER_INTERVAL // 2):
+            self.p.record_fast_fail_check('A', 0, is_consistent=True)
+            self.p.record_fast_fail_check('C', 1, is_consistent=False)
+        order = [entry[:2] for entry in self.p.get_fast_fail_order()]
+        self.assertEqual(order[0], ('C', 1))
+        self.assertEqual(order[-1], ('A', 0))
+
+
+class TestScore(unittest.TestCase):
+    def test_score_is_cached_by_solve(self):
+        p = Puzzle({
+            'A': CountOfType(Knave, 3, operator.eq),
+            'B': CountOfType(Knave, 2, operator.eq),
+            'C': [],
+        }, allow_monks=False)
+        score = p.get_score()
+        self.assertEqual(score, -statistics.mean(p.get_reason_counts_per_scenario()))
+        p._reason_count_masks = None
+        self.assertEqual(p.get_score(), score)
+
+    def test_analytics_come_from_rejection_masks(self):
+        p = Puzzle({
+            'A': [IsOfType('B', Knave), Honesty('A', 'C', operator.gt)],
+            'B': CountOfType(Knight, 1, operator.eq),
+            'C': IsSameAs('A', 'B'),
+        })
+        p.solve()
+        reasons = p.get_rejection_reason_lists()
+        self.assertEqual(len(reasons), p.get_total_possibilities())
+        for name in p.character_names:
+            rejected = {index for index, scenario_reasons in enumerate(reasons)
+                        if any(r.character_name == name for r in scenario_reasons)}
+            self.assertEqual(set(iter_mask_indexes(p.get_rejected_mask(name))), rejected)
+        self.assertEqual(
+            p.get_character_helpfulness_hist(),
+            {name: sum(r.character_name == name for rs in reasons for r in rs) for name in p.character_names})
+        self.assertEqual(sum(p.get_rejection_reasons_histogram().values()), sum(map(len, reasons)))
+        self.assertEqual(p.get_mean_reason_count(), statistics.mean(p.get_reason_counts_per_scenario()))
+        # Nothing per scenario is kept once solved.
+        self.assertEqual(len(p._reason_count_masks), p.num_characters + 1)
+
+
+class TestTruthTableMemo(unittest.TestCase):
+    def test_shared_sub_statements_hit_the_memo(self):
+        shared = IsSameAs('A', 'B')
+        p = Puzzle({
+            'A': [shared, Not(shared)],
+            'B': Biconditional(shared, IsOfType('C', Knight)),
+            'C': [],
+        })
+        p.solve()
+        # `shared` is looked up three times but evaluated once.
+        self.assertEqual(p._memo_hits, 2)
+        self.assertEqual(p._memo_misses, 4)
+        self.assertEqual(p.get_memo_hit_rate(), 2 / 6)
+
+    def test_memo_does_not_change_results(self):
+        space = ScenarioSpace(['A', 'B', 'C'], max_num_monks=1)
+        statement = IfConnective(IsSameAs('A', 'B'), Not(IsSameAs('A', 'B')))
+        table = space.truth_table(statement)
+        misses = space.memo_misses
+        self.assertEqual(space.truth_table(statement), table)
+        self.assertEqual(space.memo_misses, misses)
+        space.clear_memo()
+        self.assertEqual(statement.evaluate_truth_table(space), table)
+
+    def test_forks_share_precomputed_tables(self):
+        shared = ScenarioSpace(['A', 'B', 'C'], max_num_monks=1)
+        atom = IsSameAs('A', 'B')
+        shared.precompute_truth_tables([atom])
+        statements = {
+            'A': [Not(atom)],
+            'B': [atom],
+            'C': [IsOfType('A', Knave)],
+        }
+        p = Puzzle(statements, space=shared)
+        p.solve()
+        self.assertIsNot(p.space, shared)
+        self.assertEqual(shared.memo_misses, 0)
+        self.assertEqual(p._memo_misses, 2)  # Not(atom) and IsOfType; atom itself was precomputed.
+        self.assertNotIn(Not(atom), shared._truth_tables)
+        q = Puzzle(statements)
+        q.solve()
+        self.assertEqual(p.get_solution_count(), q.get_solution_count())
+        self.assertEqual(p.get_score(), q.get_score())
+
+    def test_incompatible_space_is_ignored(self):
+        shared = ScenarioSpace(['A', 'B'], max_num_monks=0)
+        p = Puzzle({'A': [IsSameAs('A', 'B')], 'B': [], 'C': []}, space=shared)
+        p.solve()
+        self.assertEqual(set(p.space.character_names), {'A', 'B', 'C'})
+
+
+class TestEditing(unittest.TestCase):
+    def setUp(self):
+        self.statements = {
+            'A': [IsSameAs('A', 'B'), CountOfType(Monk, 1, operator.eq)],
+            'B': [Honesty('B', 'C', operator.gt)],
+            'C': [IsOfType('A', Knave)],
+        }
+        self.p = Puzzle(self.statements)
+        self.p.solve()
+
+    def assertSolvedLike(self, statements):
+        fresh = Puzzle(statements)
+        self.assertEqual(self.p.get_consistent_scenario_set(), fresh.get_consistent_scenario_set())
+        self.assertEqual(self.p.get_score(), fresh.get_score())
+        self.assertEqual(self.p.get_rejection_reasons_histogram(), fresh.get_rejection_reasons_histogram())
+
+    def test_replace_statement(self):
+        self.p.replace_statement('B', 0, Not(IsOfType('C', Knight)))
+        self.assertFalse(self.p.is_solved)
+        self.p.solve()
+        # Only the new statement and its sub-statement were evaluated.
+        self.assertEqual(self.p._memo_misses, 2)
+        self.assertSolvedLike(dict(self.statements, B=[Not(IsOfType('C', Knight))]))
+        self.assertEqual(self.statements['B'], [Honesty('B', 'C', operator.gt)])
+
+    def test_add_and_remove_statements(self):
+        self.p.add_statement('C', AllDifferent())
+        self.p.remove_statement('A', 0)
+        self.assertSolvedLike(dict(self.statements, A=[CountOfType(Monk, 1, operator.eq)], C=[IsOfType('A', Knave), AllDifferent()]))
+        self.assertEqual(self.p._memo_misses, 1)
+
+    def test_unknown_character(self):
+        with self.assertRaises(CharacterIdentifierError):
+            self.p.add_statement('D', AllTheSame())
+
+
+class TestSpeakerMasks(unittest.TestCase):
+    def test_unchanged_speakers_are_not_reevaluated(self):
+        shared = ScenarioSpace(['A', 'B', 'C', 'D'], max_num_monks=1)
+        statements = {
+            'A': [IsSameAs('A', 'B')],
+            'B': [CountOfType(Knave, 2, operator.le)],
+            'C': [Honesty('C', 'D', operator.gt)],
+            'D': [IsOfType('A', Knight)],
+        }
+        p = Puzzle(statements, space=shared)
+        p.count_solutions()
+        self.assertEqual(shared.speaker_masks.misses, 4)
+        q = Puzzle(dict(statements, D=[IsOfType('A', Knave)]), space=shared)
+        q.count_solutions()
+        self.assertEqual(shared.speaker_masks.hits, 3)
+        self.assertEqual(shared.speaker_masks.misses, 5)
+        self.assertEqual(q.get_consistent_scenario_set(), Puzzle(dict(statements, D=[IsOfType('A', Knave)])).get_consistent_scenario_set())
+
+    def test_budget_evicts_least_recently_used(self):
+        cache = LruMaskCache(max_bytes=3 * (LruMaskCache.entry_overhead + sys.getsizeof(1 << 100)))
+        for key in range(3):
+            cache.put(key, 1 << 100)
+        cache.get(0)
+        cache.put(3, 1 << 100)
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(0), 1 << 100)
+
+    def test_pickles_leave_masks_out(self):
+        space = ScenarioSpace(['A', 'B'], max_num_monks=0)
+        space.speaker_masks.put('key', 1)
+        self.assertEqual(len(pickle.loads(pickle.dumps(space)).speaker_masks), 0)
+
+
+class TestPuzzlesByBacktracking(TestPuzzles):
+    engine = ENGINE_BACKTRACKING
+
+
+class TestPuzzlesBySat(TestPuzzles):
+    engine = ENGINE_SAT
+
+
+class TestSatSolver(unittest.TestCase):
+    def test_unsatisfiable(self):
+        solver = SatSolver()
+        a = solver.new_var()
+        solver.add_clause([a])
+        solver.add_clause([-a])
+        self.assertIsNone(solver.solve())
+
+    def test_counts_models(self):
+        solver = SatSolver()
+        a, b, c = solver.new_var(), solver.new_var(), solver.new_var()
+        solver.add_clause([a, b, c])
+        self.assertEqual(len(list(solver.iter_models([a, b, c]))), 7)
+
+    def test_stops_early(self):
+        solver = SatSolver()
+        variables = [solver.new_var() for _ in range(10)]
+        models = list(itertools.islice(solver.iter_models(variables), 3))
+        self.assertEqual(len(models), 3)
+        self.assertEqual(len({tuple(sorted(m.items())) for m in models}), 3)
+
+
+class TestPartialTruth(unittest.TestCase):
+    def setUp(self):
+        self.p = Puzzle({'A': [], 'B': [], 'C': []}, allow_monks=False)
+        self.s = PartialScenario(puzzle=self.p, character_types={'A': Knave})
+
+    def test_decided_atoms(self):
+        self.assertFalse(IsOfType('A', Knight).evaluate_partial_truth(self.s))
+        self.assertFalse(IsOfType('A', Monk).evaluate_partial_truth(self.s))
+        self.assertTrue(CountOfType(Knave, 1, operator.ge).evaluate_partial_truth(self.s))
+
+    def test_undecided_atoms(self):
+        self.assertIsNone(IsOfType('B', Knight).evaluate_partial_truth(self.s))
+        self.assertIsNone(IsSameAs('A', 'B').evaluate_partial_truth(self.s))
+        self.assertIsNone(CountOfType(Knave, 2, operator.ge).evaluate_partial_truth(self.s))
+
+    def test_monk_free_puzzle_decides_monk_claims(self):
+        self.assertFalse(IsOfType('B', Monk).evaluate_partial_truth(self.s))
+        self.assertTrue(Honesty('A', 'B', operator.le).evaluate_partial_truth(self.s))
+
+    def test_connectives(self):
+        unknown = IsOfType('B', Knight)
+        self.assertTrue(IfConnective(IsOfType('A', Knight), unknown).evaluate_partial_truth(self.s))
+        self.assertFalse(ConjunctiveStatement(unknown, IsOfType('A', Knight)).evaluate_partial_truth(self.s))
+        self.assertTrue(DisjunctiveStatement(unknown, IsOfType('A', Knave)).evaluate_partial_truth(self.s))
+        self.assertIsNone(Biconditional(unknown, IsOfType('A', Knave)).evaluate_partial_truth(self.s))
+        self.assertIsNone(Not(unknown).evaluate_partial_truth(self.s))
+
+    def test_many_characters(self):
+        names = ['C{}'.format(i) for i in range(12)]
+        css = {name: IsOfType(names[(i + 1) % len(names)], Knave) for i, name in enumerate(names)}
+        p = Puzzle(css, allow_monks=False, engine=ENGINE_BACKTRACKING)
+        self.assertTrue(p.is_valid_puzzle())
+        self.assertSetEqual(p.get_consistent_scenario_set(), {
+            Scenario(puzzle=p, character_types={
+                name: Knight if i % 2 == parity else Knave for i, name in enumerate(names)
+            })
+            for parity in (0, 1)
+        })
+
+
+class CrashingGenerator(PuzzleGenerator):
+    batches_left = 4
+
+    def generate_puzzle_batch(self, *args, **kwargs):
+        if self.batches_left == 0:
+            raise KeyboardInterrupt
+        self.batches_left -= 1
+        return super().generate_puzzle_batch(*args, **kwargs)
+
+
+class TestPuzzleGenerator(unittest.TestCase):
+    def setUp(self):
+        self.gen = PuzzleGenerator(['A', 'B', 'C', 'D'], [IsSameAs, CountOfType, Honesty])
+
+    def test_batch_is_reproducible(self):
+        a = self.gen.generate_puzzle_batch(seed=7, candidate_count=200)
+        b = self.gen.generate_puzzle_batch(seed=7, candidate_count=200)
+        self.assertEqual(a.valid_puzzle_count, b.valid_puzzle_count)
+        self.assertEqual([p.code_repr() for p in a.good_puzzles], [p.code_repr() for p in b.good_puzzles])
+
+    def test_batch_puzzles_are_good(self):
+        batch = self.gen.generate_puzzle_batch(seed=3, candidate_count=300)
+        self.assertEqual(batch.candidate_count, 300)
+        self.assertLessEqual(len(batch.good_puzzles), batch.valid_puzzle_count)
+        for puzzle in batch.good_puzzles:
+            self.assertTrue(puzzle.is_valid_puzzle())
+            self.assertTrue(PuzzleGenerator.is_good_puzzle(puzzle))
+
+    def make_small_generator(self, top_k=500):
+        gen = PuzzleGenerator(['A', 'B', 'C', 'D'], [IsSameAs, CountOfType, Honesty], top_k=top_k)
+        gen.early_break = 2.5e-15  # About 1,000 candidates.
+        gen.batch_size = 100
+        return gen
+
+    def test_resumes_from_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            uninterrupted_path = os.path.join(directory, 'uninterrupted.pickle')
+            self.make_small_generator().generate_puzzles(
+                to_file=False, seed=5, checkpoint_path=uninterrupted_path, checkpoint_every=1)
+
+            resumed_path = os.path.join(directory, 'resumed.pickle')
+            crashing = self.make_small_generator()
+            crashing.__class__ = CrashingGenerator
+            with self.assertRaises(KeyboardInterrupt):
+                crashing.generate_puzzles(to_file=False, seed=5, checkpoint_path=resumed_path, checkpoint_every=1)
+            self.assertEqual(len(PuzzleGenerator.load_checkpoint(resumed_path)['completed_batches']), 4)
+            # The seed is ignored on resume; the checkpoint's random state wins.
+            self.make_small_generator().generate_puzzles(
+                to_file=False, seed=6, checkpoint_path=resumed_path, checkpoint_every=1)
+
+            uninterrupted = PuzzleGenerator.load_checkpoint(uninterrupted_path)
+            resumed = PuzzleGenerator.load_checkpoint(resumed_path)
+        self.assertEqual(resumed['candidate_count'], uninterrupted['candidate_count'])
+        self.assertEqual(resumed['valid_puzzle_count'], uninterrupted['valid_puzzle_count'])
+        self.assertSetEqual(resumed['seen_puzzles'], uninterrupted['seen_puzzles'])
+        self.assertEqual(
+            sorted(entry[-1].code_repr() for entry in resumed['top_puzzles']),
+            sorted(entry[-1].code_repr() for entry in uninterrupted['top_puzzles']),
+        )
+
+    def test_resumed_run_writes_each_puzzle_once(self):
+        def read_found_file(directory):
+            with open(os.path.join(directory, 'good_puzzles_found.txt')) as f:
+                return f.read()
+
+        def find_puzzles(text):
+            # Only each record's code, since its statistics include cache hit rates that depend on the run.
+            return re.findall(r'^Puzzle\(\{$.*?^\}\)$', text, re.MULTILINE | re.DOTALL)
+
+        working_directory = os.getcwd()
+        with tempfile.TemporaryDirectory() as uninterrupted_directory, \
+                tempfile.TemporaryDirectory() as resumed_directory, \
+                contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            try:
+                os.chdir(uninterrupted_directory)
+                gen = self.make_small_generator()
+                gen.generate_puzzles(seed=5, checkpoint_path='checkpoint.pickle', checkpoint_every=1)
+
+                os.chdir(resumed_directory)
+                with open('good_puzzles_found.txt', 'w') as f:
+                    print('Left over from an earlier run.', file=f)
+                crashing = self.make_small_generator()
+                crashing.__class__ = CrashingGenerator
+                # Saves a checkpoint every 3 batches, so the crash comes a batch after the last one.
+                with self.assertRaises(KeyboardInterrupt):
+                    crashing.generate_puzzles(seed=5, checkpoint_path='checkpoint.pickle', checkpoint_every=3)
+                self.make_small_generator().generate_puzzles(checkpoint_path='checkpoint.pickle', checkpoint_every=3)
+            finally:
+                os.chdir(working_directory)
+            uninterrupted_text = read_found_file(uninterrupted_directory)
+            resumed_text = read_found_file(resumed_directory)
+        self.assertNotIn('Left over', resumed_text)
+        uninterrupted, resumed = find_puzzles(uninterrupted_text), find_puzzles(resumed_text)
+        self.assertEqual(len(uninterrupted), gen.checkpoint['good_puzzle_count'])
+        self.assertEqual(len(set(resumed)), len(resumed))
+        self.assertEqual(resumed, uninterrupted)
+
+    def test_workers_find_the_same_puzzles(self):
+        runs = []
+        for workers in (1, 2):
+            gen = self.make_small_generator(top_k=3)
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                found = list(gen.iter_good_puzzles(workers=workers, seed=7))
+            runs.append((gen, found))
+        (single, single_found), (pooled, pooled_found) = runs
+        self.assertEqual(pooled.checkpoint['candidate_count'], single.checkpoint['candidate_count'])
+        self.assertEqual(pooled.checkpoint['good_puzzle_count'], single.checkpoint['good_puzzle_count'])
+        self.assertGreater(single.checkpoint['good_puzzle_count'], 3)  # So the top 3 leave some out.
+        # Only a single process shares seen candidates across batches, so it counts more of them as duplicates.
+        self.assertEqual(
+            pooled.checkpoint['valid_puzzle_count'] + pooled.checkpoint['duplicate_count'],
+            single.checkpoint['valid_puzzle_count'] + single.checkpoint['duplicate_count'],
+        )
+        self.assertSetEqual(pooled.checkpoint['seen_puzzles'], single.checkpoint['seen_puzzles'])
+        self.assertEqual(
+            sorted(p.get_fingerprint() for p in pooled_found), sorted(p.get_fingerprint() for p in single_found))
+        self.assertEqual(
+            [p.get_score() for p in pooled.get_top_puzzles()], [p.get_score() for p in single.get_top_puzzles()])
+        for puzzle in pooled.get_top_puzzles():
+            self.assertTrue(PuzzleGenerator.is_good_puzzle(puzzle))
+
+    def test_streams_good_puzzles(self):
+        gen = self.make_small_generator(top_k=3)
+        with contextlib.redirect_stdout(io.StringIO()):
+            streamed = list(gen.iter_good_puzzles(seed=1))
+        self.assertGreater(len(streamed), 3)
+        self.assertEqual(len(streamed), gen.checkpoint['good_puzzle_count'])
+        self.assertEqual(len({p.code_repr() for p in streamed}), len(streamed))
+        top = gen.get_top_puzzles()
+        self.assertEqual(len(top), 3)
+        self.assertEqual(
+            [p.get_score() for p in top],
+            sorted((p.get_score() for p in streamed), reverse=True)[:3],
+        )
+
+    def test_annealing_finds_distinct_good_puzzles(self):
+        gen = self.make_small_generator(top_k=5)
+        with contextlib.redirect_stderr(io.StringIO()):
+            found = list(gen.iter_good_puzzles_by_annealing(steps=1000, seed=2))
+        self.assertGreater(len(found), 5)
+        self.assertEqual(gen.checkpoint['candidate_count'], 1000)
+        self.assertEqual(len({p.get_fingerprint() for p in found}), len(found))
+        for puzzle in found:
+            self.assertTrue(puzzle.is_valid_puzzle())
+            self.assertTrue(PuzzleGenerator.is_good_puzzle(puzzle))
+            self.assertLess(gen.get_energy(puzzle), 0)
+        with contextlib.redirect_stderr(io.StringIO()):
+            again = list(self.make_small_generator().iter_good_puzzles_by_annealing(steps=1000, seed=2))
+        self.assertEqual([p.get_fingerprint() for p in again], [p.get_fingerprint() for p in found])
+
+    def test_annealing_only_offers_new_candidates(self):
+        gen = self.make_small_generator()
+        with contextlib.redirect_stderr(io.StringIO()):
+            found = list(gen.iter_good_puzzles_by_annealing(steps=2000, seed=1))
+        # Rejected moves leave the current puzzle as it was, and it isn't offered again.
+        self.assertLess(gen.checkpoint['duplicate_count'], len(found) / 4)
+
+    def test_annealing_with_every_statement_in_use(self):
+        class FullGenerator(PuzzleGenerator):
+            statements_needed = 12
+
+        gen = FullGenerator(['A', 'B', 'C'], [IsSameAs, CountOfType, Honesty])
+        self.assertEqual(len(gen.generate_possible_statements()), gen.statements_needed)
+        with contextlib.redirect_stderr(io.StringIO()):
+            list(gen.iter_good_puzzles_by_annealing(steps=50, seed=1))
+        self.assertEqual(gen.checkpoint['candidate_count'], 50)
+
+    def test_constructed_puzzles_are_good(self):
+        gen = self.make_small_generator()
+        with contextlib.redirect_stderr(io.StringIO()):
+            built = list(gen.iter_good_puzzles_by_construction(attempts=100, seed=4))
+        self.assertGreater(len(built), 10)
+        for puzzle in built:
+            self.assertEqual(puzzle.get_solution_count(), 2)
+            self.assertTrue(puzzle.is_valid_puzzle())
+            self.assertTrue(PuzzleGenerator.is_good_puzzle(puzzle))
+            self.assertTrue(all(len(statements) <= 3 for statements in puzzle.character_statements.values()))
+        self.assertEqual(len({p.get_fingerprint() for p in built}), len(built))
+
+    def test_arrangement_changes_visit_every_arrangement_once(self):
+        for value_count, slot_count in [(3, 1), (4, 2), (5, 3), (6, 4), (5, 5)]:
+            slots = list(range(slot_count))
+            visited = [tuple(slots)]
+            for slot, value in iter_arrangement_changes(value_count, slot_count):
+                self.assertNotEqual(slots[slot], value)
+                slots[slot] = value
+                if len(set(slots)) == slot_count:
+                    visited.append(tuple(slots))
+            self.assertEqual(sorted(visited), sorted(itertools.permutations(range(value_count), slot_count)))
+
+    def test_exhaustive_search_covers_every_candidate(self):
+        class SmallGenerator(PuzzleGenerator):
+            statements_needed = 3
+            slots_per_speaker = 1
+
+            @staticmethod
+            def make_statement(speaker_index, s):
+                return Not(s[0]) if speaker_index == 1 else s[0]
+
+        gen = SmallGenerator(['A', 'B', 'C'], [IsSameAs, CountOfType, Honesty])
+        with contextlib.redirect_stderr(io.StringIO()):
+            found = list(gen.iter_good_puzzles_exhaustively())
+        valid_count = 0
+        good = set()
+        for statements in itertools.permutations(gen.generate_possible_statements(), 3):
+            puzzle = gen.make_puzzle(list(statements))
+            if puzzle.is_valid_puzzle():
+                valid_count += 1
+                if gen.is_good_puzzle(puzzle):
+                    good.add(puzzle.get_fingerprint())
+        self.assertEqual(gen.checkpoint['candidate_count'], 12 * 11 * 10)
+        self.assertEqual(gen.checkpoint['valid_puzzle_count'], valid_count)
+        self.assertGreater(len(found), 0)
+        self.assertEqual({p.get_fingerprint() for p in found}, good)
+        self.assertEqual(len(found), gen.checkpoint['good_puzzle_count'])
+
+    def test_budget_progress_and_eta(self):
+        with self.assertRaises(ValueError):
+            SearchBudget()
+        budget = SearchBudget(good_puzzle_count=10)
+        budget.start()
+        self.assertIsNone(budget.get_eta(100, 0))
+        self.assertAlmostEqual(budget.get_progress(5), 0.5)
+        self.assertFalse(budget.is_spent(9))
+        self.assertTrue(budget.is_spent(10))
+        self.assertEqual(budget.get_eta(200, 10), 0)
+        budget.start_time -= 4
+        candidate_rate, good_rate = budget.get_rates(400, 4)
+        self.assertAlmostEqual(candidate_rate, 100, delta=1)
+        self.assertAlmostEqual(good_rate, 1, delta=0.01)
+        self.assertAlmostEqual(budget.get_eta(400, 4), 6, delta=0.1)
+
+        # A resumed run's rates and ETA cover the time and counts of the run it continues.
+        resumed = SearchBudget(seconds=10, good_puzzle_count=1000)
+        resumed.start(elapsed_seconds=4)
+        self.assertAlmostEqual(resumed.get_progress(0), 0.4, delta=0.01)
+        self.assertAlmostEqual(resumed.get_eta(400, 4), 6, delta=0.1)
+        self.assertAlmostEqual(resumed.get_rates(400, 4)[0], 100, delta=1)
+
+    def test_resumed_budget_counts_time_already_spent(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            path = os.path.join(directory, 'checkpoint.pickle')
+            crashing = self.make_small_generator()
+            crashing.__class__ = CrashingGenerator
+            with self.assertRaises(KeyboardInterrupt):
+                crashing.generate_puzzles(to_file=False, seed=5, checkpoint_path=path, checkpoint_every=1, seconds=600)
+            checkpoint = PuzzleGenerator.load_checkpoint(path)
+            self.assertGreater(checkpoint['elapsed_seconds'], 0)
+            checkpoint['elapsed_seconds'] = 600  # As if the run had crashed right at the end of its budget.
+            PuzzleGenerator.save_checkpoint(path, checkpoint)
+
+            gen = self.make_small_generator()
+            gen.generate_puzzles(to_file=False, checkpoint_path=path, seconds=600)
+        self.assertEqual(gen.checkpoint['candidate_count'], checkpoint['candidate_count'])
+        self.assertGreaterEqual(gen.checkpoint['elapsed_seconds'], 600)
+
+    def test_stops_on_good_puzzle_count(self):
+        for search in (SEARCH_RANDOM, SEARCH_ANNEALING, SEARCH_CONSTRUCTIVE):
+            gen = self.make_small_generator()
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                gen.generate_puzzles(to_file=False, seed=3, search=search, good_puzzle_count=5)
+            self.assertGreaterEqual(gen.checkpoint['good_puzzle_count'], 5)
+            if search != SEARCH_RANDOM:
+                # Only the random search stops between batches rather than right after the last puzzle it needed.
+                self.assertEqual(gen.checkpoint['good_puzzle_count'], 5)
+
+    def test_exhaustive_search_takes_a_limit(self):
+        gen = self.make_small_generator()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            gen.generate_puzzles(to_file=False, search=SEARCH_EXHAUSTIVE, limit=500)
+        self.assertEqual(gen.checkpoint['candidate_count'], 500)
+        with self.assertRaises(ValueError):
+            gen.generate_puzzles(to_file=False, limit=500)
+
+    def test_spent_time_budget_checks_nothing(self):
+        gen = self.make_small_generator()
+        with contextlib.redirect_stderr(io.StringIO()):
+            found = list(gen.iter_good_puzzles_exhaustively(budget=SearchBudget(seconds=0)))
+        self.assertEqual(found, [])
+        self.assertEqual(gen.checkpoint['candidate_count'], 0)
 
+    def test_annealing_runs_in_one_process(self):
+        with self.assertRaises(ValueError):
+            self.make_small_generator().generate_puzzles(to_file=False, workers=2, search=SEARCH_ANNEALING)